@@ -2,33 +2,41 @@
 Authentication Endpoints
 User registration, login, and profile management with refresh tokens and session management
 """
+import asyncio
 from datetime import datetime
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status, Request
-from bson import ObjectId
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, BackgroundTasks
+from pymongo.errors import DuplicateKeyError
 
 from app.schemas.user import (
-    UserRegister, UserLogin, Token, UserResponse, User,
+    UserRegister, UserLogin, Token, UserResponse,
     RefreshTokenRequest, SessionResponse
 )
 from app.core.auth import (
     get_password_hash,
     verify_password,
+    password_needs_rehash,
+    rehash_password,
     create_access_token,
     create_refresh_token,
     decode_refresh_token,
-    get_current_user
+    CurrentUser,
+    get_user_by_id,
 )
 from app.core.session import (
     create_session,
     validate_session,
     revoke_session,
     revoke_all_sessions,
-    get_user_sessions
+    get_user_sessions,
+    find_session_by_fingerprint,
+    get_fingerprint,
+    get_current_session_id
 )
 from app.core.rate_limit import limiter, AUTH_RATE_LIMIT
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import get_async_db
 from app.core.logging import logger
+from app.core.helpers import make_etag, etag_matches
 from app.core.time import now_ist, format_ist
 
 router = APIRouter()
@@ -36,37 +44,27 @@ router = APIRouter()
 
 @router.post("/auth/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 @limiter.limit(AUTH_RATE_LIMIT)
-async def register(request: Request, user_data: UserRegister):
+async def register(
+    request: Request,
+    user_data: UserRegister,
+    fingerprint: Tuple[str, str] = Depends(get_fingerprint)
+):
     """
     Register a new user
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Database unavailable"
         )
     
-    # Check if username already exists
-    if db.users.find_one({"username": user_data.username}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    # Check if email already exists
-    if db.users.find_one({"email": user_data.email}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
     # Create user document
     created_at = now_ist()
     user_doc = {
         "username": user_data.username,
         "email": user_data.email,
-        "password_hash": get_password_hash(user_data.password),
+        "password_hash": await get_password_hash(user_data.password),
         "created_at": created_at,
         "created_at_str": format_ist(created_at, include_tz=True),
         "active": True,
@@ -76,15 +74,22 @@ async def register(request: Request, user_data: UserRegister):
         }
     }
     
-    result = db.users.insert_one(user_doc)
+    # Unique indexes on username/email reject duplicates atomically
+    try:
+        result = await db.users.insert_one(user_doc)
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        field = "Email" if "email" in key_pattern else "Username"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{field} already registered"
+        )
     user_id = str(result.inserted_id)
     
     logger.info(f"[Auth] New user registered: {user_data.username} (ID: {user_id})")
     
     # Create session
-    ip_address = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "unknown")
-    session_id = create_session(user_id, ip_address, user_agent)
+    session_id = await create_session(user_id, *fingerprint)
     
     # Create tokens
     access_token = create_access_token(
@@ -97,11 +102,16 @@ async def register(request: Request, user_data: UserRegister):
 
 @router.post("/auth/login", response_model=Token)
 @limiter.limit(AUTH_RATE_LIMIT)
-async def login(request: Request, credentials: UserLogin):
+async def login(
+    request: Request,
+    credentials: UserLogin,
+    background_tasks: BackgroundTasks,
+    fingerprint: Tuple[str, str] = Depends(get_fingerprint)
+):
     """
     Login with username and password
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -109,7 +119,7 @@ async def login(request: Request, credentials: UserLogin):
         )
     
     # Find user by username
-    user_doc = db.users.find_one({"username": credentials.username})
+    user_doc = await db.users.find_one({"username": credentials.username})
     
     if not user_doc:
         raise HTTPException(
@@ -118,7 +128,7 @@ async def login(request: Request, credentials: UserLogin):
         )
     
     # Verify password
-    if not verify_password(credentials.password, user_doc["password_hash"]):
+    if not await verify_password(credentials.password, user_doc["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -134,10 +144,12 @@ async def login(request: Request, credentials: UserLogin):
     user_id = str(user_doc["_id"])
     logger.info(f"[Auth] User logged in: {credentials.username} (ID: {user_id})")
     
+    # Upgrade hashes made with weaker Argon2 parameters after the response is sent
+    if password_needs_rehash(user_doc["password_hash"]):
+        background_tasks.add_task(rehash_password, user_id, credentials.password, user_doc["password_hash"])
+    
     # Create session
-    ip_address = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "unknown")
-    session_id = create_session(user_id, ip_address, user_agent)
+    session_id = await create_session(user_id, *fingerprint)
     
     # Create tokens
     access_token = create_access_token(
@@ -149,10 +161,16 @@ async def login(request: Request, credentials: UserLogin):
 
 
 @router.get("/auth/me", response_model=UserResponse)
-async def get_current_user_info(user: User = Depends(get_current_user)):
+async def get_current_user_info(user: CurrentUser, request: Request, response: Response):
     """
     Get current authenticated user information
+    Supports If-None-Match (304 when unchanged)
     """
+    etag = make_etag(user.id, user.username, user.email, user.active)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     return UserResponse(
         id=user.id,
         username=user.username,
@@ -162,7 +180,8 @@ async def get_current_user_info(user: User = Depends(get_current_user)):
 
 
 @router.post("/auth/refresh", response_model=Token)
-async def refresh_token(token_request: RefreshTokenRequest):
+@limiter.limit(AUTH_RATE_LIMIT)
+async def refresh_token(request: Request, token_request: RefreshTokenRequest):
     """
     Refresh access token using refresh token
     """
@@ -172,28 +191,20 @@ async def refresh_token(token_request: RefreshTokenRequest):
     session_id = token_data["session_id"]
     
     # Validate session is still active
-    if not validate_session(session_id, user_id):
+    if not await validate_session(session_id, user_id):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session has been revoked"
         )
     
-    # Get user from database
-    db = get_db()
-    if db is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database unavailable"
-        )
-    
-    user_doc = db.users.find_one({"_id": ObjectId(user_id)})
-    if not user_doc:
+    user = await get_user_by_id(user_id)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    if not user_doc.get("active", True):
+    if not user.active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
@@ -201,7 +212,7 @@ async def refresh_token(token_request: RefreshTokenRequest):
     
     # Create new access token
     access_token = create_access_token(
-        data={"user_id": user_id, "username": user_doc["username"]}
+        data={"user_id": user_id, "username": user.username}
     )
     
     logger.info(f"[Auth] Token refreshed for user {user_id}")
@@ -210,7 +221,7 @@ async def refresh_token(token_request: RefreshTokenRequest):
 
 
 @router.post("/auth/logout")
-async def logout(token_request: RefreshTokenRequest, user: User = Depends(get_current_user)):
+async def logout(token_request: RefreshTokenRequest, user: CurrentUser):
     """
     Logout and revoke refresh token/session
     """
@@ -219,7 +230,7 @@ async def logout(token_request: RefreshTokenRequest, user: User = Depends(get_cu
         session_id = token_data["session_id"]
         
         # Revoke the session
-        revoked = revoke_session(session_id, user.id)
+        revoked = await revoke_session(session_id, user.id)
         
         if revoked:
             logger.info(f"[Auth] User {user.username} logged out, session {session_id} revoked")
@@ -233,41 +244,38 @@ async def logout(token_request: RefreshTokenRequest, user: User = Depends(get_cu
 
 
 @router.get("/auth/sessions", response_model=List[SessionResponse])
-async def get_sessions(request: Request, user: User = Depends(get_current_user)):
+async def get_sessions(
+    user: CurrentUser,
+    fingerprint: Tuple[str, str] = Depends(get_fingerprint)
+):
     """
     Get all active sessions for the current user
     """
-    sessions = get_user_sessions(user.id)
-    
-    # Get current session info to mark it
-    current_ip = request.client.host if request.client else "unknown"
-    current_ua = request.headers.get("user-agent", "unknown")
+    # Fetch the list and the current session (to mark it) concurrently
+    sessions, current_session_id = await asyncio.gather(
+        get_user_sessions(user.id),
+        find_session_by_fingerprint(user.id, *fingerprint),
+    )
     
-    response_sessions = []
-    for session in sessions:
-        is_current = (
-            session["ip_address"] == current_ip and 
-            session["user_agent"] == current_ua
-        )
-        
-        response_sessions.append(SessionResponse(
+    return [
+        SessionResponse(
             session_id=session["session_id"],
             device=session["device"],
             ip_address=session["ip_address"],
             created_at_str=session["created_at_str"],
             last_active_str=session["last_active_str"],
-            is_current=is_current
-        ))
-    
-    return response_sessions
+            is_current=session["session_id"] == current_session_id
+        )
+        for session in sessions
+    ]
 
 
 @router.delete("/auth/sessions/{session_id}")
-async def revoke_session_endpoint(session_id: str, user: User = Depends(get_current_user)):
+async def revoke_session_endpoint(session_id: str, user: CurrentUser):
     """
     Revoke a specific session
     """
-    revoked = revoke_session(session_id, user.id)
+    revoked = await revoke_session(session_id, user.id)
     
     if revoked:
         logger.info(f"[Auth] Session {session_id} revoked by user {user.username}")
@@ -281,27 +289,17 @@ async def revoke_session_endpoint(session_id: str, user: User = Depends(get_curr
 
 @router.post("/auth/sessions/revoke-all")
 async def revoke_all_sessions_endpoint(
-    request: Request,
+    user: CurrentUser,
     keep_current: bool = True,
-    user: User = Depends(get_current_user)
+    current_session_id: Optional[str] = Depends(get_current_session_id)
 ):
     """
     Revoke all sessions except optionally the current one
     """
-    current_session_id = None
-    
-    if keep_current:
-        # Try to find current session
-        current_ip = request.client.host if request.client else "unknown"
-        current_ua = request.headers.get("user-agent", "unknown")
-        sessions = get_user_sessions(user.id)
-        
-        for session in sessions:
-            if session["ip_address"] == current_ip and session["user_agent"] == current_ua:
-                current_session_id = session["session_id"]
-                break
-    
-    count = revoke_all_sessions(user.id, except_session_id=current_session_id)
+    count = await revoke_all_sessions(
+        user.id,
+        except_session_id=current_session_id if keep_current else None
+    )
     
     logger.info(f"[Auth] Revoked {count} sessions for user {user.username}")
     
@@ -2,50 +2,53 @@
 Chat Routes
 AI chat endpoints with session management
 """
-import asyncio
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from app.schemas.chat import ChatMessage, ChatResponse
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import get_async_db
 from app.services.session_service import session_manager
-from app.services.llm_service import ask_llm
+from app.services.llm_service import ask_llm_async, ask_llm_stream
 from app.core.logging import logger
 
 router = APIRouter()
 
+# Static prompt parts, joined around the user message and context per request
+_PROMPT_PREFIX = "You are a helpful DevOps assistant.\nUser asks: "
+_PROMPT_SUFFIX = "\n\nProvide a helpful, concise answer. Explain technical concepts simply if asked."
 
-@router.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(message: ChatMessage):
-    """
-    Chat with AI assistant
-    Maintains conversation context through sessions
-    """
-    db = get_db()
 
+async def _resolve_session(message: ChatMessage, db) -> str:
+    """Continue the given chat session, or start a new one"""
     session_id = message.session_id
-    if not session_id or not session_manager.get_session(session_id, db):
-        session_id = session_manager.create_session(db)
+    if not session_id or not await session_manager.get_session(session_id, db):
+        session_id = await session_manager.create_session(db)
         logger.info(f"[Chat] New conversation session: {session_id}")
     else:
         logger.info(f"[Chat] Continuing session: {session_id}")
+    return session_id
+
 
+def _build_prompt(message: ChatMessage) -> str:
     context_str = ""
     if message.context:
-        context_lines = ["Context:"]
-        for k, v in message.context.items():
-            if k != "session_id":
-                context_lines.append(f"- {k}: {v}")
-        context_str = "\n".join(context_lines)
+        context_str = "\n".join(
+            ["Context:", *(f"- {k}: {v}" for k, v in message.context.items() if k != "session_id")]
+        )
 
-    prompt = f"""You are a helpful DevOps assistant.
-User asks: {message.message}
+    return "".join((_PROMPT_PREFIX, message.message, "\n\n", context_str, _PROMPT_SUFFIX))
 
-{context_str}
 
-Provide a helpful, concise answer. Explain technical concepts simply if asked."""
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(message: ChatMessage):
+    """
+    Chat with AI assistant
+    Maintains conversation context through sessions
+    """
+    db = await get_async_db()
+    session_id = await _resolve_session(message, db)
+    prompt = _build_prompt(message)
 
-    result = await asyncio.get_event_loop().run_in_executor(
-        None,
-        ask_llm,
+    result = await ask_llm_async(
         prompt,
         "AI Chat",
         {"user_message": message.message, **message.context},
@@ -53,9 +56,37 @@ Provide a helpful, concise answer. Explain technical concepts simply if asked.""
     )
 
     response_text, tokens = result if result else (None, 0)
-    session_manager.update_session(session_id, db, tokens)
+    await session_manager.update_session(session_id, db, tokens)
 
     return {
         "response": response_text or "Sorry, I'm having trouble connecting to the AI service.",
         "session_id": session_id,
     }
+
+
+@router.post("/api/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    """
+    Chat with AI assistant, streaming the answer as plain text
+    Session id is returned in the X-Session-Id header
+    """
+    db = await get_async_db()
+    session_id = await _resolve_session(message, db)
+    prompt = _build_prompt(message)
+
+    async def _stream():
+        usage = {"total_tokens": 0}
+        try:
+            async for chunk in ask_llm_stream(prompt, usage):
+                yield chunk
+        except Exception as e:
+            logger.error(f"[Chat] Stream failed: {e}")
+            yield "Sorry, I'm having trouble connecting to the AI service."
+        finally:
+            await session_manager.update_session(session_id, db, usage["total_tokens"])
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Session-Id": session_id},
+    )
@@ -1,27 +1,87 @@
 """
 Configuration Routes - Fixed for Frontend
 """
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import uuid
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks, status
 from app.schemas.config import EmailConfig
-from app.services.mongodb_service import get_db
+from pymongo import ReturnDocument
+from app.services.mongodb_service import get_async_db
 from app.services.email_service import send_alert
 from app.services.slack_service import send_slack_alert_text, slack_is_configured
-from app.core.auth import get_current_user
-from app.schemas.user import User
+from app.core.auth import CurrentUser
+from app.core.cache import invalidate_cached_responses
+from app.core.rate_limit import limiter, TEST_ALERT_RATE_LIMIT
+from app.core.logging import logger
+from app.core.helpers import make_etag, etag_matches
+from app.services.redis_service import cache_get, cache_set
 
 router = APIRouter()
 
+# Test alerts are sent in the background; their outcome is kept this long for polling
+TEST_STATUS_TTL = 300
+
+TEST_EMAIL_SUBJECT = "[TEST] AI DevOps Monitor"
+TEST_EMAIL_BODY = """
+        <h2>✅ Test Email</h2>
+        <p>This is a test email from your AI DevOps Monitoring system.</p>
+        <p>If you received this, your email configuration is working correctly!</p>
+        <p><strong>Time:</strong> Email alerts are now active.</p>
+        """
+EMAIL_CONFIG_PROJECTION = {"_id": 0, "enabled": 1, "recipients": 1, "config_version": 1}
+
+TEST_SLACK_TEXT = "✅ [TEST] AI DevOps Monitor: Slack webhook is working!"
+
+
+def _test_status_key(task_id: str) -> str:
+    return f"test-status:{task_id}"
+
+
+async def _start_test_alert(background_tasks: BackgroundTasks, owner_id: str, channel: str,
+                            failure_detail: str, send, *args, **kwargs) -> dict:
+    """Record a pending test alert and schedule the send after the response"""
+    task_id = uuid.uuid4().hex
+    state = {"task_id": task_id, "user_id": owner_id, "channel": channel, "status": "pending"}
+    await cache_set(_test_status_key(task_id), state, TEST_STATUS_TTL)
+    background_tasks.add_task(_run_test_alert, state, failure_detail, send, *args, **kwargs)
+    return {"task_id": task_id, "status": "pending"}
+
+
+async def _run_test_alert(state: dict, failure_detail: str, send, *args, **kwargs):
+    """Send a test alert in a worker thread and store the outcome"""
+    try:
+        ok = await asyncio.to_thread(send, *args, **kwargs)
+    except Exception as e:
+        logger.error(f"[Config] Test {state['channel']} error: {e}")
+        ok = False
+
+    state = {**state, "status": "sent" if ok else "failed"}
+    if not ok:
+        state["detail"] = failure_detail
+    await cache_set(_test_status_key(state["task_id"]), state, TEST_STATUS_TTL)
+
 
 @router.get("/agent/email-config")
-def get_email_config(user: User = Depends(get_current_user)):
-    """Get email configuration for current user"""
-    db = get_db()
+async def get_email_config(user: CurrentUser, request: Request, response: Response):
+    """Get email configuration for current user (If-None-Match gets a 304 when unchanged)"""
+    db = await get_async_db()
     if db is None:
         return {"enabled": False, "recipients": []}
 
-    config = db.email_config.find_one({"user_id": user.id})
-    if not config:
-        return {"enabled": False, "recipients": []}
+    # Read, creating the default on first access, in one atomic round trip
+    config = await db.email_config.find_one_and_update(
+        {"user_id": user.id},
+        {"$setOnInsert": {"enabled": False, "recipients": [], "config_version": 0}},
+        upsert=True,
+        projection=EMAIL_CONFIG_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    # config_version is bumped on every update, so it identifies the representation
+    etag = make_etag(user.id, config.get("config_version", 0))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
 
     return {
         "enabled": config.get("enabled", False), 
@@ -30,55 +90,65 @@ def get_email_config(user: User = Depends(get_current_user)):
 
 
 @router.put("/agent/email-config")
-def update_email_config(config: EmailConfig, user: User = Depends(get_current_user)):
+async def update_email_config(config: EmailConfig, user: CurrentUser):
     """Update email configuration for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    db.email_config.update_one(
+    await db.email_config.update_one(
         {"user_id": user.id},
-        {"$set": {"enabled": config.enabled, "recipients": config.recipients, "user_id": user.id}},
+        {
+            "$set": {"enabled": config.enabled, "recipients": config.recipients, "user_id": user.id},
+            "$inc": {"config_version": 1},
+        },
         upsert=True,
     )
+    await invalidate_cached_responses(user.id)
     return {"message": "Email config updated"}
 
 
-@router.post("/agent/test-email")
-def send_test_email(user: User = Depends(get_current_user)):
-    """Send test email for current user"""
-    success = send_alert(
-        "[TEST] AI DevOps Monitor",
-        """
-        <h2>✅ Test Email</h2>
-        <p>This is a test email from your AI DevOps Monitoring system.</p>
-        <p>If you received this, your email configuration is working correctly!</p>
-        <p><strong>Time:</strong> Email alerts are now active.</p>
-        """,
-        user_id=user.id
-    )
-    if success:
-        return {"message": "Test email sent successfully!"}
-    raise HTTPException(
-        status_code=500, 
-        detail="Failed to send test email. Check SMTP settings in .env file."
+@router.post("/agent/test-email", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit(TEST_ALERT_RATE_LIMIT)
+async def send_test_email(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user: CurrentUser
+):
+    """Queue a test email for current user; poll /agent/test-status/{task_id} for the result"""
+    return await _start_test_alert(
+        background_tasks, user.id, "email",
+        "Failed to send test email. Check SMTP settings in .env file.",
+        send_alert, TEST_EMAIL_SUBJECT, TEST_EMAIL_BODY, user_id=user.id,
     )
 
 
-@router.post("/agent/test-slack")
-def test_slack(user: User = Depends(get_current_user)):
-    """Send test Slack message for current user"""
-    if not slack_is_configured(user_id=user.id):
+@router.post("/agent/test-slack", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit(TEST_ALERT_RATE_LIMIT)
+async def test_slack(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user: CurrentUser
+):
+    """Queue a test Slack message for current user; poll /agent/test-status/{task_id} for the result"""
+    if not await asyncio.to_thread(slack_is_configured, user_id=user.id):
         raise HTTPException(
             status_code=400,
             detail="Slack is not configured. Enable it in Settings → Alerts & Servers."
         )
     
-    ok = send_slack_alert_text("✅ [TEST] AI DevOps Monitor: Slack webhook is working!", user_id=user.id)
-    if ok:
-        return {"message": "Test Slack message sent successfully!"}
-    
-    raise HTTPException(
-        status_code=500, 
-        detail="Failed to send Slack message. Check webhook URL."
-    )
\ No newline at end of file
+    return await _start_test_alert(
+        background_tasks, user.id, "slack",
+        "Failed to send Slack message. Check webhook URL.",
+        send_slack_alert_text, TEST_SLACK_TEXT, user_id=user.id,
+    )
+
+
+@router.get("/agent/test-status/{task_id}")
+async def get_test_status(task_id: str, user: CurrentUser):
+    """Get the outcome of a queued test email/Slack message (pending, sent or failed)"""
+    state = await cache_get(_test_status_key(task_id))
+    if not state or state.get("user_id") != user.id:
+        raise HTTPException(status_code=404, detail="Test not found or expired")
+
+    return {k: v for k, v in state.items() if k != "user_id"}
@@ -8,25 +8,33 @@ Fixes:
 """
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from datetime import datetime, timedelta
-from app.services.mongodb_service import get_db
-from app.schemas.user import User
-from app.core.auth import get_current_user
+import asyncio
+import base64
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from app.services.mongodb_service import SORT_TS_FIELD, get_async_db
+from app.services.session_service import session_manager
+from app.core.auth import CurrentUser
+from app.core.helpers import make_etag, etag_matches
+from app.core.cache import (
+    GRAFANA_CACHE_TTL, LIST_CACHE_TTL, STATS_CACHE_TTL, cached_response, invalidate_cached_responses,
+)
+from app.core.responses import ORJSONResponse, orjson_dumps
 
 router = APIRouter()
 
 
-def _iso(d):
-    if isinstance(d, datetime):
-        return d.isoformat()
-    return d
-
-
-def _stringify_id(doc: dict, field: str = "_id"):
-    if field in doc:
-        doc[field] = str(doc[field])
-    return doc
+# Rows per page when no limit is given, and the most one request may ask for;
+# full exports page through with the keyset cursor (or stream with format=ndjson)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
 
 
 def _clamp_limit(limit: int, default: int, max_limit: int):
@@ -39,39 +47,310 @@ def _clamp_limit(limit: int, default: int, max_limit: int):
     return min(limit, max_limit)
 
 
+# Projections: only the fields the handlers and UI read (legacy names kept for fallbacks)
+_WINDOW_FIELDS = {
+    "window_start_ist": 1, "window_end_ist": 1, "window_start": 1, "window_end": 1,
+    "window_start_ist_str": 1, "window_end_ist_str": 1,
+}
+_SOURCE_FIELDS = {"instance": 1, "ip": 1, "port": 1}
+# kept in the output so the page cursor can be built from the last row
+_SORT_FIELDS = {SORT_TS_FIELD: 1}
+
+BATCH_PROJECTION = {
+    "collected_at_ist": 1, "collected_at": 1, "timestamp": 1, "collected_at_ist_str": 1,
+    **_WINDOW_FIELDS, **_SOURCE_FIELDS, **_SORT_FIELDS,
+    "metrics_count": 1, "metrics": 1,
+}
+
+# incidents have no fixed UI field set; drop only the raw LLM payload, which the
+# structured fields already carry
+INCIDENT_PROJECTION = {"raw_analysis": 0}
+
+ANOMALY_PROJECTION = {
+    "created_at_ist": 1, "created_at": 1, "timestamp": 1, "created_at_ist_str": 1,
+    **_WINDOW_FIELDS, **_SOURCE_FIELDS, **_SORT_FIELDS,
+    "batch_id": 1, "incident_id": 1,
+    "metric": 1, "observed": 1, "expected": 1, "symptom": 1, "severity": 1, "cluster": 1,
+}
+
+RCA_PROJECTION = {
+    "timestamp_ist": 1, "timestamp": 1, "created_at_ist": 1, "created_at": 1, "timestamp_ist_str": 1,
+    **_WINDOW_FIELDS, **_SOURCE_FIELDS, **_SORT_FIELDS,
+    "batch_id": 1, "incident_id": 1, "anomaly_id": 1,
+    "metric": 1, "summary": 1, "cause": 1, "fix": 1,
+}
+
+# Named field sets selectable with ?fields=; "full" returns whole documents (detail views)
+BATCH_FIELD_SETS = {
+    "default": BATCH_PROJECTION,
+    "summary": {k: v for k, v in BATCH_PROJECTION.items() if k != "metrics"},
+    "full": None,
+}
+INCIDENT_FIELD_SETS = {
+    "default": INCIDENT_PROJECTION,
+    "summary": {
+        "created_at_ist": 1, "created_at": 1, "timestamp": 1, "created_at_ist_str": 1,
+        **_WINDOW_FIELDS, **_SOURCE_FIELDS, **_SORT_FIELDS,
+        "batch_id": 1, "title": 1, "severity": 1, "confidence": 1, "summary": 1,
+    },
+    "full": None,
+}
+ANOMALY_FIELD_SETS = {
+    "default": ANOMALY_PROJECTION,
+    # anomaly rows carry no bulky fields, so the summary is the default row
+    "summary": ANOMALY_PROJECTION,
+    "full": None,
+}
+RCA_FIELD_SETS = {
+    "default": RCA_PROJECTION,
+    "summary": {k: v for k, v in RCA_PROJECTION.items() if k not in ("cause", "fix")},
+    "full": None,
+}
+
+# Single canonical sort key (newest first, _id breaks ties)
+BATCH_SORT = INCIDENT_SORT = ANOMALY_SORT = RCA_SORT = SORT_TS_FIELD
+
+# Server-side normalisation: ObjectIds to strings and one UI timestamp per doc,
+# so results come back JSON-ready (datetimes are rendered by orjson)
+def _oids_to_strings(*fields: str) -> dict:
+    return {f: {"$toString": f"${f}"} for f in fields}
+
+
+_ID_TO_STRING = _oids_to_strings("_id")
+_INCIDENT_OID_FIELDS = ("batch_id",)
+_ANOMALY_OID_FIELDS = ("batch_id", "incident_id")
+_RCA_OID_FIELDS = ("batch_id", "incident_id", "anomaly_id")
+_WINDOW_OUTPUT = {
+    "window_start": {"$ifNull": ["$window_start_ist", "$window_start"]},
+    "window_end": {"$ifNull": ["$window_end_ist", "$window_end"]},
+}
+
+BATCH_OUTPUT = {
+    **_ID_TO_STRING, **_WINDOW_OUTPUT,
+    "collected_at": {"$ifNull": ["$collected_at_ist", "$collected_at", "$timestamp"]},
+}
+
+INCIDENT_OUTPUT = {
+    **_ID_TO_STRING, **_WINDOW_OUTPUT, **_oids_to_strings(*_INCIDENT_OID_FIELDS),
+    "timestamp": {"$ifNull": ["$created_at_ist", "$created_at", "$timestamp"]},
+}
+
+ANOMALY_OUTPUT = {
+    **_ID_TO_STRING, **_oids_to_strings(*_ANOMALY_OID_FIELDS),
+    "timestamp": {"$ifNull": ["$created_at_ist", "$created_at", "$timestamp"]},
+    "severity": {"$ifNull": ["$severity", "medium"]},
+}
+
+RCA_OUTPUT = {
+    **_ID_TO_STRING, **_WINDOW_OUTPUT, **_oids_to_strings(*_RCA_OID_FIELDS),
+    "timestamp": {"$ifNull": ["$timestamp_ist", "$timestamp", "$created_at_ist", "$created_at"]},
+}
+
+
+_ONE_HOUR = timedelta(hours=1)
+
+
+def _encode_cursor(value: Any, oid: str) -> str:
+    """Opaque keyset cursor for the last row of a page: (sort value, _id)"""
+    payload: dict = {"i": oid}
+    if isinstance(value, datetime):
+        payload["d"] = value.isoformat()
+    elif value is not None:
+        payload["v"] = value
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Tuple[Any, ObjectId]:
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        oid = ObjectId(payload["i"])
+        value = datetime.fromisoformat(payload["d"]) if "d" in payload else payload.get("v")
+        return value, oid
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def _after_cursor(match: dict, sort_field: str, after: str) -> dict:
+    """Rows strictly after the cursor in (sort_field desc, _id desc) order; missing values sort last"""
+    value, oid = _decode_cursor(after)
+    if value is None:
+        cond = {sort_field: None, "_id": {"$lt": oid}}
+    else:
+        cond = {"$or": [
+            {sort_field: {"$lt": value}},
+            {sort_field: value, "_id": {"$lt": oid}},
+            {sort_field: None},
+        ]}
+    return {"$and": [match, cond]} if match else cond
+
+
+def _field_set(field_sets: dict, fields: Optional[str]) -> Optional[dict]:
+    name = fields or "default"
+    if name not in field_sets:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields '{name}', expected one of: {', '.join(field_sets)}",
+        )
+    return field_sets[name]
+
+
+def _list_pipeline(match: dict, sort_field: str, limit: int, after: Optional[str],
+                   skip: int, projection: Optional[dict], output: dict) -> list:
+    """
+    Sorted page (newest first) with ID/timestamp conversion done by Mongo.
+    Keyset pagination via `after` (cost independent of page depth); `skip` is the
+    deprecated offset fallback, ignored when a cursor is given.
+    """
+    if after:
+        match = _after_cursor(match, sort_field, after)
+        skip = 0
+
+    pipeline = [{"$match": match}, {"$sort": {sort_field: -1, "_id": -1}}]
+    if skip:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    pipeline.append({"$addFields": output})
+    return pipeline
+
+
+def _next_cursor(last: Optional[dict], count: int, sort_field: str, limit: int) -> Optional[str]:
+    if last is None or count < limit:
+        return None
+    return _encode_cursor(last.get(sort_field), last["_id"])
+
+
+async def _list_etag(collection, match: dict, sort_field: str, *params) -> str:
+    """
+    Cheap validator for a list page: the newest row of the filter set (one indexed
+    lookup) plus the request's paging params. Changes whenever a row is added.
+    """
+    head = await collection.find_one(match, {"_id": 1}, sort=[(sort_field, -1), ("_id", -1)])
+    return make_etag(head["_id"] if head else None, *params)
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+async def _list_docs(collection, match: dict, sort_field: str, limit: int,
+                     after: Optional[str] = None, skip: int = 0,
+                     projection: Optional[dict] = None,
+                     output: dict = _ID_TO_STRING) -> Tuple[list, Optional[str]]:
+    """Returns (docs, next_cursor); next_cursor is None on the last page."""
+    pipeline = _list_pipeline(match, sort_field, limit, after, skip, projection, output)
+    cursor = await collection.aggregate(pipeline)
+    docs = await cursor.to_list(None)
+    return docs, _next_cursor(docs[-1] if docs else None, len(docs), sort_field, limit)
+
+
+def _ndjson_response(collection, match: dict, sort_field: str, limit: int,
+                     after: Optional[str] = None, skip: int = 0,
+                     projection: Optional[dict] = None,
+                     output: dict = _ID_TO_STRING) -> StreamingResponse:
+    """
+    Same page as _list_docs, streamed one JSON row per line as the cursor is read
+    (constant memory). A final {"next_cursor": ...} line follows when more rows exist.
+    """
+    pipeline = _list_pipeline(match, sort_field, limit, after, skip, projection, output)
+
+    async def rows():
+        cursor = await collection.aggregate(pipeline)
+        last, count = None, 0
+        async for doc in cursor:
+            last, count = doc, count + 1
+            yield orjson_dumps(doc) + b"\n"
+        next_cursor = _next_cursor(last, count, sort_field, limit)
+        if next_cursor:
+            yield orjson_dumps({"next_cursor": next_cursor}) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
 @router.get("/stats")
-def get_stats(user: User = Depends(get_current_user)):
-    """Get stats for current user only"""
-    db = get_db()
+@cached_response(STATS_CACHE_TTL)
+async def get_stats(user: CurrentUser):
+    """Get stats for current user only (cached for a few seconds per user)"""
+    db = await get_async_db()
     if db is None:
         return {"collections": {}}
 
-    user_filter = {"user_id": user.id}
+    return await _compute_stats(db, user.id)
+
+
+def _count_facet(subsets: dict) -> dict:
+    """$facet stage counting all input docs ("total") plus each named sub-filter"""
+    facets = {"total": [{"$count": "n"}]}
+    for name, sub_match in subsets.items():
+        facets[name] = [{"$match": sub_match}, {"$count": "n"}]
+    return {"$facet": facets}
+
+
+# Built once; only the leading $match varies per user
+_ANOMALY_COUNTS = _count_facet({"open": {"severity": {"$in": ["critical", "high"]}}})
+
+
+async def _facet_counts(collection, match: dict, facet_stage: dict) -> dict:
+    """Run a _count_facet stage over `match`; returns {"total": n, <name>: n, ...}"""
+    cursor = await collection.aggregate([{"$match": match}, facet_stage])
+    result = (await cursor.to_list(1) or [{}])[0]
+    return {name: (result.get(name) or [{"n": 0}])[0]["n"] for name in facet_stage["$facet"]}
+
+
+async def _compute_stats(db, user_id: str) -> dict:
+    user_filter = {"user_id": user_id}
+
+    email_config, slack_config = await asyncio.gather(
+        db.email_config.find_one(user_filter, {"_id": 0, "enabled": 1, "recipients": 1}),
+        db.slack_config.find_one(user_filter, {"_id": 0, "enabled": 1, "webhook_url": 1}),
+    )
+    email_config = email_config or {}
+    slack_config = slack_config or {}
 
-    email_config = db.email_config.find_one(user_filter) or {}
     email_enabled = email_config.get("enabled", False)
     email_recipients = len(email_config.get("recipients", []))
 
-    slack_config = db.slack_config.find_one(user_filter) or {}
     slack_enabled = slack_config.get("enabled", False)
     slack_webhook = slack_config.get("webhook_url", "")
 
+    active_since = datetime.now(timezone.utc) - _ONE_HOUR
+
+    # Independent counts run concurrently; counts sharing a collection are fused into one $facet
+    (
+        batches_total,
+        incidents_total,
+        metrics_total,
+        anomalies,
+        rca_total,
+        chat,
+    ) = await asyncio.gather(
+        db.metrics_batches.count_documents(user_filter),
+        db.incidents.count_documents(user_filter),
+        db.metrics.count_documents(user_filter),
+        _facet_counts(db.anomalies, user_filter, _ANOMALY_COUNTS),
+        db.rca.count_documents(user_filter),
+        # the active window moves with the clock, so this facet is built per call
+        _facet_counts(db.chat_sessions, user_filter, _count_facet({
+            "active": {"last_activity": {"$gte": active_since}},
+        })),
+    )
+
     return {
         "collections": {
-            "metrics_batches": {"total": db.metrics_batches.count_documents(user_filter)},
-            "incidents": {"total": db.incidents.count_documents(user_filter)},
-            "metrics": {"total": db.metrics.count_documents(user_filter)},
+            "metrics_batches": {"total": batches_total},
+            "incidents": {"total": incidents_total},
+            "metrics": {"total": metrics_total},
             "anomalies": {
-                "total": db.anomalies.count_documents(user_filter),
-                "open": db.anomalies.count_documents({**user_filter, "severity": {"$in": ["critical", "high"]}}),
-                "analyzed": db.rca.count_documents(user_filter),
+                "total": anomalies["total"],
+                "open": anomalies["open"],
+                "analyzed": rca_total,
             },
             "chat_sessions": {
-                "total": db.chat_sessions.count_documents(user_filter),
-                "active": db.chat_sessions.count_documents({
-                    **user_filter,
-                    "last_activity": {"$gte": datetime.utcnow() - timedelta(hours=1)}
-                }),
+                "total": chat["total"],
+                "active": chat["active"],
             },
         },
         "notifications": {
@@ -81,339 +360,367 @@ def get_stats(user: User = Depends(get_current_user)):
     }
 
 
+# Base Grafana URL and dashboard UID (from the dashboard JSON); only the instance varies per call
+GRAFANA_BASE_URL = "http://localhost:3001"
+GRAFANA_DASHBOARD_UID = "server-monitoring"
+GRAFANA_URL_TEMPLATE = (
+    f"{GRAFANA_BASE_URL}/d/{GRAFANA_DASHBOARD_UID}/server-monitoring"
+    "?orgId=1&var-instance={}&from=now-30m&to=now&refresh=30s"
+)
+
+
+@lru_cache(maxsize=1024)
+def _grafana_url(instance: str) -> str:
+    return GRAFANA_URL_TEMPLATE.format(quote(instance, safe=":"))
+
+
 @router.get("/grafana-url")
-def get_grafana_url(
-    instance: str = Query(..., description="Server instance (e.g., 192.168.1.4:9182)"),
-    user: User = Depends(get_current_user)
+@cached_response(GRAFANA_CACHE_TTL)
+async def get_grafana_url(
+    user: CurrentUser,
+    instance: str = Query(..., description="Server instance (e.g., 192.168.1.4:9182)")
 ):
     """
     Generate Grafana dashboard URL for a specific instance
     Returns URL with pre-selected instance, 30-minute time range, and 30s auto-refresh
     """
-    # Base Grafana URL (can be configured via environment variable)
-    grafana_base = "http://localhost:3001"
-    
-    # Dashboard UID from the JSON file
-    dashboard_uid = "server-monitoring"
-    
-    # Build URL with parameters
-    grafana_url = (
-        f"{grafana_base}/d/{dashboard_uid}/server-monitoring"
-        f"?orgId=1"
-        f"&var-instance={instance}"
-        f"&from=now-30m"
-        f"&to=now"
-        f"&refresh=30s"
-    )
-    
     return {
-        "grafana_url": grafana_url,
+        "grafana_url": _grafana_url(instance),
         "instance": instance,
         "dashboard": "Server Monitoring"
     }
 
 
-
 @router.get("/batches")
-def get_batches(
-    user: User = Depends(get_current_user),
-    limit: int = Query(10000, ge=1),
-    skip: int = Query(0, ge=0),
+@cached_response(LIST_CACHE_TTL)
+async def get_batches(
+    request: Request,
+    user: CurrentUser,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    skip: int = Query(0, ge=0, description="Deprecated: offset paging, use after"),
+    fields: Optional[str] = Query(None, description="Named field set: default | summary | full"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$",
+                     description="ndjson streams rows one per line"),
 ):
     """Get batches for current user only"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"batches": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
 
-    # Prefer new IST fields, fallback to older ones if present
-    sort_fields = [("collected_at_ist", -1), ("collected_at", -1), ("timestamp", -1)]
+    args = (db.metrics_batches, {"user_id": user.id}, BATCH_SORT, limit, after, skip,
+            _field_set(BATCH_FIELD_SETS, fields), BATCH_OUTPUT)
+    etag = await _list_etag(db.metrics_batches, {"user_id": user.id}, BATCH_SORT, limit, after, skip, fields, fmt)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
-    cursor = db.metrics_batches.find({"user_id": user.id}).sort(sort_fields).skip(skip).limit(limit)
-    docs = list(cursor)
+    if fmt == "ndjson":
+        response = _ndjson_response(*args)
+        response.headers["ETag"] = etag
+        return response
 
-    for d in docs:
-        _stringify_id(d)
-        # send UI-friendly timestamps
-        d["collected_at"] = _iso(d.get("collected_at_ist") or d.get("collected_at") or d.get("timestamp"))
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    docs, next_cursor = await _list_docs(*args)
 
-    return {"batches": docs}
+    return ORJSONResponse({"batches": docs, "next_cursor": next_cursor}, headers={"ETag": etag})
 
 
 @router.get("/incidents")
-def get_incidents(
-    user: User = Depends(get_current_user),
-    limit: int = Query(10000, ge=1),
-    skip: int = Query(0, ge=0),
+@cached_response(LIST_CACHE_TTL)
+async def get_incidents(
+    request: Request,
+    user: CurrentUser,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    skip: int = Query(0, ge=0, description="Deprecated: offset paging, use after"),
+    fields: Optional[str] = Query(None, description="Named field set: default | summary | full"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$",
+                     description="ndjson streams rows one per line"),
 ):
     """Get incidents for current user only"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"incidents": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    sort_fields = [("created_at_ist", -1), ("created_at", -1), ("timestamp", -1)]
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+
+    args = (db.incidents, {"user_id": user.id}, INCIDENT_SORT, limit, after, skip,
+            _field_set(INCIDENT_FIELD_SETS, fields), INCIDENT_OUTPUT)
+    etag = await _list_etag(db.incidents, {"user_id": user.id}, INCIDENT_SORT, limit, after, skip, fields, fmt)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
-    docs = list(db.incidents.find({"user_id": user.id}).sort(sort_fields).skip(skip).limit(limit))
-    for d in docs:
-        _stringify_id(d)
-        if "batch_id" in d:
-            d["batch_id"] = str(d.get("batch_id") or "")
-        # Consistent timestamp for frontend
-        d["timestamp"] = _iso(d.get("created_at_ist") or d.get("created_at") or d.get("timestamp"))
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    if fmt == "ndjson":
+        response = _ndjson_response(*args)
+        response.headers["ETag"] = etag
+        return response
 
-    return {"incidents": docs}
+    docs, next_cursor = await _list_docs(*args)
+
+    return ORJSONResponse({"incidents": docs, "next_cursor": next_cursor}, headers={"ETag": etag})
 
 
 @router.get("/anomalies")
-def get_anomalies(
-    user: User = Depends(get_current_user),
-    limit: int = Query(10000, ge=1),
-    skip: int = Query(0, ge=0),
+@cached_response(LIST_CACHE_TTL)
+async def get_anomalies(
+    request: Request,
+    user: CurrentUser,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    skip: int = Query(0, ge=0, description="Deprecated: offset paging, use after"),
+    fields: Optional[str] = Query(None, description="Named field set: default | summary | full"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$",
+                     description="ndjson streams rows one per line"),
 ):
     """
     Get anomalies for current user only
     Supports pagination: /anomalies?limit=10000&skip=0
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"anomalies": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-
-    # ✅ Prefer new IST field, fallback to old
-    sort_fields = [("created_at_ist", -1), ("created_at", -1), ("timestamp", -1)]
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
 
-    docs = list(db.anomalies.find({"user_id": user.id}).sort(sort_fields).skip(skip).limit(limit))
-    for d in docs:
-        _stringify_id(d)
+    args = (db.anomalies, {"user_id": user.id}, ANOMALY_SORT, limit, after, skip,
+            _field_set(ANOMALY_FIELD_SETS, fields), ANOMALY_OUTPUT)
+    etag = await _list_etag(db.anomalies, {"user_id": user.id}, ANOMALY_SORT, limit, after, skip, fields, fmt)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
-        # ✅ UI timestamp always populated
-        d["timestamp"] = _iso(d.get("created_at_ist") or d.get("created_at") or d.get("timestamp"))
+    if fmt == "ndjson":
+        response = _ndjson_response(*args)
+        response.headers["ETag"] = etag
+        return response
 
-        if "incident_id" in d:
-            d["incident_id"] = str(d.get("incident_id") or "")
-        if "batch_id" in d:
-            d["batch_id"] = str(d.get("batch_id") or "")
+    docs, next_cursor = await _list_docs(*args)
 
-        if "severity" not in d:
-            d["severity"] = "medium"
-
-    return {"anomalies": docs}
+    return ORJSONResponse({"anomalies": docs, "next_cursor": next_cursor}, headers={"ETag": etag})
 
 
 @router.get("/rca")
-def get_rca(
-    user: User = Depends(get_current_user),
-    limit: int = Query(10000, ge=1),
-    skip: int = Query(0, ge=0),
+@cached_response(LIST_CACHE_TTL)
+async def get_rca(
+    request: Request,
+    user: CurrentUser,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    skip: int = Query(0, ge=0, description="Deprecated: offset paging, use after"),
+    fields: Optional[str] = Query(None, description="Named field set: default | summary | full"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$",
+                     description="ndjson streams rows one per line"),
 ):
     """
     Get RCA results for current user only
     Supports pagination: /rca?limit=10000&skip=0
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"rca": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+
+    args = (db.rca, {"user_id": user.id}, RCA_SORT, limit, after, skip,
+            _field_set(RCA_FIELD_SETS, fields), RCA_OUTPUT)
+    etag = await _list_etag(db.rca, {"user_id": user.id}, RCA_SORT, limit, after, skip, fields, fmt)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
-    # ✅ Prefer timestamp_ist / timestamp_ist_str if you use it, fallback otherwise
-    sort_fields = [("timestamp_ist", -1), ("timestamp", -1), ("created_at_ist", -1), ("created_at", -1)]
+    if fmt == "ndjson":
+        response = _ndjson_response(*args)
+        response.headers["ETag"] = etag
+        return response
 
-    docs = list(db.rca.find({"user_id": user.id}).sort(sort_fields).skip(skip).limit(limit))
-    for d in docs:
-        _stringify_id(d)
-        d["timestamp"] = _iso(d.get("timestamp_ist") or d.get("timestamp") or d.get("created_at_ist") or d.get("created_at"))
-        # Convert all ObjectId fields to strings
-        if "batch_id" in d and d["batch_id"]:
-            d["batch_id"] = str(d["batch_id"])
-        if "incident_id" in d and d["incident_id"]:
-            d["incident_id"] = str(d["incident_id"])
-        if "anomaly_id" in d and d["anomaly_id"]:
-            d["anomaly_id"] = str(d["anomaly_id"])
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    docs, next_cursor = await _list_docs(*args)
 
-    return {"rca": docs}
+    return ORJSONResponse({"rca": docs, "next_cursor": next_cursor}, headers={"ETag": etag})
 
 
 @router.get("/prom-metrics")
-def get_prom_metrics(limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
-    db = get_db()
+@cached_response(LIST_CACHE_TTL)
+async def get_prom_metrics(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0)):
+    db = await get_async_db()
     if db is None:
         return {"metrics": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.metrics.find().sort([("timestamp", -1)]).skip(skip).limit(limit))
-    for d in docs:
-        _stringify_id(d)
-        d["timestamp"] = _iso(d.get("timestamp"))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.metrics, {}, "timestamp", limit, after, skip)
 
-    return {"metrics": docs}
+    return ORJSONResponse({"metrics": docs, "next_cursor": next_cursor})
 
 
 @router.get("/api/sessions")
-def get_sessions(limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
-    db = get_db()
+@cached_response(LIST_CACHE_TTL)
+async def get_sessions(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0)):
+    db = await get_async_db()
     if db is None:
         return {"sessions": []}
 
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    sessions = list(db.chat_sessions.find().sort("last_activity", -1).skip(skip).limit(limit))
-    for s in sessions:
-        _stringify_id(s)
-        s["created_at"] = _iso(s.get("created_at"))
-        s["last_activity"] = _iso(s.get("last_activity"))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    sessions, next_cursor = await _list_docs(db.chat_sessions, {}, "last_activity", limit, after, skip)
 
-    return {"sessions": sessions}
+    return ORJSONResponse({"sessions": sessions, "next_cursor": next_cursor})
 
 
 @router.get("/api/sessions/{session_id}")
-def get_session_details(session_id: str):
-    db = get_db()
+async def get_session_details(session_id: str):
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    from app.services.session_service import session_manager
-    session = session_manager.get_session(session_id, db)
+    session = await session_manager.get_session(session_id, db)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    _stringify_id(session)
-    session["created_at"] = _iso(session.get("created_at"))
-    session["last_activity"] = _iso(session.get("last_activity"))
-    return session
+    return ORJSONResponse(session)
 
 
 @router.delete("/api/sessions/{session_id}")
-def delete_session(session_id: str):
-    db = get_db()
+async def delete_session(session_id: str):
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    result = db.chat_sessions.delete_one({"session_id": session_id})
+    result = await db.chat_sessions.delete_one({"session_id": session_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    from app.services.session_service import session_manager
-    if session_id in session_manager.active_sessions:
-        del session_manager.active_sessions[session_id]
-
+    await session_manager.evict_session(session_id)
+    await invalidate_cached_responses()
     return {"message": "Session deleted successfully"}
 
 
 # ============ IP-FILTERED ENDPOINTS ============
 
 @router.get("/metrics/by-ip")
-def get_metrics_by_ip(ip: str, limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
+@cached_response(LIST_CACHE_TTL)
+async def get_metrics_by_ip(ip: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0),
+                  fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
     """Get metrics filtered by IP address"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"metrics": []}
     
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.metrics_batches.find({"ip": ip}).sort([("collected_at_ist", -1)]).skip(skip).limit(limit))
-    
-    for d in docs:
-        _stringify_id(d)
-        d["collected_at"] = _iso(d.get("collected_at_ist") or d.get("collected_at"))
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.metrics_batches, {"ip": ip}, BATCH_SORT, limit, after, skip,
+                                         _field_set(BATCH_FIELD_SETS, fields), BATCH_OUTPUT)
     
-    return {"metrics": docs, "total": len(docs), "ip": ip}
+    return ORJSONResponse({"metrics": docs, "total": len(docs), "ip": ip, "next_cursor": next_cursor})
 
 
 @router.get("/anomalies/by-ip")
-def get_anomalies_by_ip(ip: str, limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
+@cached_response(LIST_CACHE_TTL)
+async def get_anomalies_by_ip(ip: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0),
+                  fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
     """Get anomalies filtered by IP address"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"anomalies": []}
     
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.anomalies.find({"ip": ip}).sort([("created_at_ist", -1)]).skip(skip).limit(limit))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.anomalies, {"ip": ip}, ANOMALY_SORT, limit, after, skip,
+                                         _field_set(ANOMALY_FIELD_SETS, fields), ANOMALY_OUTPUT)
     
-    for d in docs:
-        _stringify_id(d)
-        d["timestamp"] = _iso(d.get("created_at_ist") or d.get("created_at") or d.get("timestamp"))
-        if "incident_id" in d:
-            d["incident_id"] = str(d.get("incident_id") or "")
-        if "batch_id" in d:
-            d["batch_id"] = str(d.get("batch_id") or "")
-        if "severity" not in d:
-            d["severity"] = "medium"
-    
-    return {"anomalies": docs, "total": len(docs), "ip": ip}
+    return ORJSONResponse({"anomalies": docs, "total": len(docs), "ip": ip, "next_cursor": next_cursor})
 
 
 @router.get("/incidents/by-ip")
-def get_incidents_by_ip(ip: str, limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
+@cached_response(LIST_CACHE_TTL)
+async def get_incidents_by_ip(ip: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0),
+                  fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
     """Get incidents filtered by IP address"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"incidents": []}
     
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.incidents.find({"ip": ip}).sort([("created_at_ist", -1)]).skip(skip).limit(limit))
-    
-    for d in docs:
-        _stringify_id(d)
-        if "batch_id" in d:
-            d["batch_id"] = str(d.get("batch_id") or "")
-        d["timestamp"] = _iso(d.get("created_at_ist") or d.get("created_at") or d.get("timestamp"))
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.incidents, {"ip": ip}, INCIDENT_SORT, limit, after, skip,
+                                         _field_set(INCIDENT_FIELD_SETS, fields), INCIDENT_OUTPUT)
     
-    return {"incidents": docs, "total": len(docs), "ip": ip}
+    return ORJSONResponse({"incidents": docs, "total": len(docs), "ip": ip, "next_cursor": next_cursor})
 
 
 @router.get("/rca/by-ip")
-def get_rca_by_ip(ip: str, limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
+@cached_response(LIST_CACHE_TTL)
+async def get_rca_by_ip(ip: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0),
+                  fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
     """Get RCA results filtered by IP address"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"rca": []}
     
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.rca.find({"ip": ip}).sort([("timestamp_ist", -1)]).skip(skip).limit(limit))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.rca, {"ip": ip}, RCA_SORT, limit, after, skip,
+                                         _field_set(RCA_FIELD_SETS, fields), RCA_OUTPUT)
     
-    for d in docs:
-        _stringify_id(d)
-        d["timestamp"] = _iso(d.get("timestamp_ist") or d.get("timestamp") or d.get("created_at_ist"))
-        # Convert all ObjectId fields to strings
-        if "batch_id" in d and d["batch_id"]:
-            d["batch_id"] = str(d["batch_id"])
-        if "incident_id" in d and d["incident_id"]:
-            d["incident_id"] = str(d["incident_id"])
-        if "anomaly_id" in d and d["anomaly_id"]:
-            d["anomaly_id"] = str(d["anomaly_id"])
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
-    
-    return {"rca": docs, "total": len(docs), "ip": ip}
+    return ORJSONResponse({"rca": docs, "total": len(docs), "ip": ip, "next_cursor": next_cursor})
 
 
 @router.get("/batches/by-ip")
-def get_batches_by_ip(ip: str, limit: int = Query(10000, ge=1), skip: int = Query(0, ge=0)):
+@cached_response(LIST_CACHE_TTL)
+async def get_batches_by_ip(ip: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                  after: Optional[str] = Query(None), skip: int = Query(0, ge=0),
+                  fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
     """Get batch results filtered by IP address"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return {"batches": []}
     
-    limit = _clamp_limit(limit, default=10000, max_limit=100000)
-    docs = list(db.metrics_batches.find({"ip": ip}).sort([("collected_at_ist", -1)]).skip(skip).limit(limit))
-    
-    for d in docs:
-        _stringify_id(d)
-        d["collected_at"] = _iso(d.get("collected_at_ist") or d.get("collected_at"))
-        d["window_start"] = _iso(d.get("window_start_ist") or d.get("window_start"))
-        d["window_end"] = _iso(d.get("window_end_ist") or d.get("window_end"))
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    docs, next_cursor = await _list_docs(db.metrics_batches, {"ip": ip}, BATCH_SORT, limit, after, skip,
+                                         _field_set(BATCH_FIELD_SETS, fields), BATCH_OUTPUT)
     
-    return {"batches": docs, "total": len(docs), "ip": ip}
+    return ORJSONResponse({"batches": docs, "total": len(docs), "ip": ip, "next_cursor": next_cursor})
+
+
+
+@router.get("/server/{ip}/summary")
+@cached_response(LIST_CACHE_TTL)
+async def get_server_summary(ip: str, user: CurrentUser, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+                             fields: Optional[str] = Query(None, description="Named field set: default | summary | full")):
+    """
+    Everything the server detail view needs in one call: the latest `limit` rows of
+    each by-ip section for the current user, queried concurrently (latency of the
+    slowest, not the sum). /metrics/by-ip serves the same batch documents, so the
+    metrics view reads them from "batches" too.
+    """
+    db = await get_async_db()
+    if db is None:
+        return {"anomalies": [], "incidents": [], "rca": [], "batches": [], "ip": ip}
+
+    limit = _clamp_limit(limit, default=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE)
+    match = {"ip": ip, "user_id": user.id}
+    # Resolve every section's projection up front so a bad name fails before any query
+    batch_fields, anomaly_fields, incident_fields, rca_fields = (
+        _field_set(field_sets, fields)
+        for field_sets in (BATCH_FIELD_SETS, ANOMALY_FIELD_SETS, INCIDENT_FIELD_SETS, RCA_FIELD_SETS)
+    )
+    (batches, _), (anomalies, _), (incidents, _), (rca, _) = await asyncio.gather(
+        _list_docs(db.metrics_batches, match, BATCH_SORT, limit,
+                   projection=batch_fields, output=BATCH_OUTPUT),
+        _list_docs(db.anomalies, match, ANOMALY_SORT, limit,
+                   projection=anomaly_fields, output=ANOMALY_OUTPUT),
+        _list_docs(db.incidents, match, INCIDENT_SORT, limit,
+                   projection=incident_fields, output=INCIDENT_OUTPUT),
+        _list_docs(db.rca, match, RCA_SORT, limit,
+                   projection=rca_fields, output=RCA_OUTPUT),
+    )
 
+    return ORJSONResponse({
+        "anomalies": anomalies,
+        "incidents": incidents,
+        "rca": rca,
+        "batches": batches,
+        "ip": ip,
+    })
@@ -2,23 +2,23 @@
 Slack Configuration Routes
 Configure Slack Webhook dynamically.
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from app.schemas.slack_config import SlackConfig
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import get_async_db
 from app.services.slack_service import slack_is_configured
-from app.core.auth import get_current_user
-from app.schemas.user import User
+from app.core.auth import CurrentUser
+from app.core.cache import invalidate_cached_responses
 
 router = APIRouter()
 
 @router.get("/agent/slack-config", response_model=SlackConfig)
-def get_slack_config(user: User = Depends(get_current_user)):
+async def get_slack_config(user: CurrentUser):
     """Get Slack configuration for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return SlackConfig(enabled=False, webhook_url="")
         
-    config = db.slack_config.find_one({"user_id": user.id})
+    config = await db.slack_config.find_one({"user_id": user.id})
     if not config:
         return SlackConfig(enabled=False, webhook_url="")
         
@@ -29,17 +29,18 @@ def get_slack_config(user: User = Depends(get_current_user)):
 
 
 @router.put("/agent/slack-config")
-def update_slack_config(config: SlackConfig, user: User = Depends(get_current_user)):
+async def update_slack_config(config: SlackConfig, user: CurrentUser):
     """Update Slack configuration for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database error")
         
-    db.slack_config.update_one(
+    await db.slack_config.update_one(
         {"user_id": user.id},
         {"$set": {"enabled": config.enabled, "webhook_url": config.webhook_url, "user_id": user.id}},
         upsert=True
     )
+    await invalidate_cached_responses(user.id)
     
     # Note: Changes take effect immediately as services check DB/Env
     return {"message": "Slack config updated"}
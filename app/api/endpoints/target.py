@@ -1,28 +1,61 @@
 """
 Target Management Routes
 Add/Remove Prometheus scrape targets dynamically.
+
+targets.json is rebuilt from MongoDB by one background writer: add/remove mark it
+dirty and wait for the flush, bursts are coalesced into one query and write, and
+the file is replaced atomically so Prometheus never reads a half-written file.
 """
-import json
+import asyncio
 import os
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
+import orjson
+from pymongo.errors import DuplicateKeyError
+from fastapi import APIRouter, HTTPException
 from app.schemas.target import Target
-from app.schemas.user import User
-from app.core.auth import get_current_user
-from app.services.mongodb_service import get_db
+from app.core.auth import CurrentUser
+from app.core.cache import invalidate_cached_responses
+from app.services.mongodb_service import get_async_db
 from app.core.logging import logger
 
 router = APIRouter()
 
-TARGETS_FILE = "targets.json"
+# Directory-mounted into the Prometheus container (see docker-compose.yml)
+TARGETS_FILE = os.path.join("targets", "targets.json")
+TARGETS_WRITE_DEBOUNCE = 1.0  # seconds to coalesce add/remove bursts
+
+TARGET_FILE_PROJECTION = {"_id": 0, "endpoint": 1, "name": 1, "user_id": 1, "labels": 1}
+
+# Writer state
+_targets_dirty = asyncio.Event()
+_writer_task: Optional[asyncio.Task] = None
+_last_written: Optional[bytes] = None
+# Callers waiting on the next flush; each gets None on success or the error message
+_waiters: List[asyncio.Future] = []
+
+
+def _write_targets_file(content: bytes):
+    """Write to a temp file and rename over TARGETS_FILE (atomic on POSIX and Windows)"""
+    os.makedirs(os.path.dirname(TARGETS_FILE), exist_ok=True)
+    tmp = f"{TARGETS_FILE}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, TARGETS_FILE)
 
-def _regenerate_targets_file(db):
-    """Regenerate targets.json from MongoDB with user_id labels"""
+
+async def _regenerate_targets_file(db) -> Optional[str]:
+    """
+    Regenerate targets.json with user_id labels from the enabled targets in MongoDB
+    (skipped when unchanged). Read fresh on every flush so targets added by other
+    workers or replicas are never dropped. Returns None on success, else the error.
+    """
+    global _last_written
     try:
-        # Get ALL enabled targets from ALL users
-        targets = list(db.targets.find({"enabled": True}))
-        
+        targets = await db.targets.find({"enabled": True}, TARGET_FILE_PROJECTION).to_list(None)
+
         file_sd_content = []
         for t in targets:
             # Include user_id in labels for filtering
@@ -37,31 +70,92 @@ def _regenerate_targets_file(db):
                 "targets": [t["endpoint"]],
                 "labels": labels
             })
-            
-        # Write to file
-        with open(TARGETS_FILE, "w") as f:
-            json.dump(file_sd_content, f, indent=2)
-            
+
+        content = orjson.dumps(file_sd_content, option=orjson.OPT_INDENT_2)
+        if content == _last_written:
+            return None
+
+        await asyncio.to_thread(_write_targets_file, content)
+        _last_written = content
+
         logger.info(f"[Targets] Regenerated {TARGETS_FILE} with {len(targets)} targets")
         logger.debug(f"[Targets] File contents: {file_sd_content}")
-        return True
+        return None
     except Exception as e:
         logger.error(f"[Targets] Failed to regenerate file: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to update targets file: {str(e)}"
-        )
+        return str(e)
+
+
+def schedule_targets_write() -> asyncio.Future:
+    """
+    Mark targets.json stale; the writer regenerates it after the debounce window.
+    The returned future resolves to None once written, or to the error message.
+    """
+    waiter = asyncio.get_running_loop().create_future()
+    _waiters.append(waiter)
+    _targets_dirty.set()
+    return waiter
+
+
+async def _flush_targets():
+    _targets_dirty.clear()
+    waiters = _waiters[:]
+    _waiters.clear()
+
+    db = await get_async_db()
+    error = await _regenerate_targets_file(db) if db is not None else "Database error"
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(error)
+
+
+async def _targets_writer():
+    while True:
+        await _targets_dirty.wait()
+        await asyncio.sleep(TARGETS_WRITE_DEBOUNCE)
+        await _flush_targets()
+
+
+async def _await_targets_write():
+    """Wait for the coalesced write covering this change; fail the request like a direct write would"""
+    error = await schedule_targets_write()
+    if error:
+        raise HTTPException(status_code=500, detail=f"Failed to update targets file: {error}")
+
+
+def start_targets_writer():
+    """Start the writer (called at startup); the file is rebuilt once"""
+    global _writer_task
+    if _writer_task is None:
+        _writer_task = asyncio.create_task(_targets_writer())
+        schedule_targets_write()
+
+
+async def stop_targets_writer():
+    """Stop the writer (called at shutdown), flushing a pending regeneration"""
+    global _writer_task
+    if _writer_task is None:
+        return
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+    _writer_task = None
+
+    if _targets_dirty.is_set():
+        await _flush_targets()
 
 
 @router.get("/agent/targets", response_model=List[Target])
-def get_targets(user: User = Depends(get_current_user)):
+async def get_targets(user: CurrentUser):
     """Get all configured targets for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return []
         
     # Filter by user_id
-    targets = list(db.targets.find({"user_id": user.id}))
+    targets = await db.targets.find({"user_id": user.id}).to_list(None)
     results = []
     for t in targets:
         results.append(Target(
@@ -74,24 +168,32 @@ def get_targets(user: User = Depends(get_current_user)):
 
 
 @router.post("/agent/targets")
-def add_target(target: Target, user: User = Depends(get_current_user)):
+async def add_target(target: Target, user: CurrentUser):
     """Add a new monitoring target for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database error")
         
-    # Check if target already exists for this user
-    if db.targets.find_one({"endpoint": target.endpoint, "user_id": user.id}):
-        raise HTTPException(status_code=400, detail="Target already exists")
-    
     # Add user_id to target document
     target_doc = target.dict()
     target_doc["user_id"] = user.id
-    
-    db.targets.insert_one(target_doc)
+
+    # Single atomic round trip: inserts only if this user has no such target yet
+    try:
+        res = await db.targets.update_one(
+            {"endpoint": target.endpoint, "user_id": user.id},
+            {"$setOnInsert": target_doc},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # lost a race with a concurrent add; the unique index rejected the second insert
+        res = None
+    if res is None or res.upserted_id is None:
+        raise HTTPException(status_code=400, detail="Target already exists")
     
     # Regenerate targets.json with ALL users' targets
-    _regenerate_targets_file(db)
+    await invalidate_cached_responses(user.id)
+    await _await_targets_write()
     
     logger.info(f"[Targets] User {user.username} added target: {target.endpoint}")
     
@@ -99,19 +201,20 @@ def add_target(target: Target, user: User = Depends(get_current_user)):
 
 
 @router.delete("/agent/targets/{endpoint}")
-def remove_target(endpoint: str, user: User = Depends(get_current_user)):
+async def remove_target(endpoint: str, user: CurrentUser):
     """Remove a target for current user"""
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise HTTPException(status_code=500, detail="Database error")
         
     # Only delete if it belongs to this user
-    res = db.targets.delete_one({"endpoint": endpoint, "user_id": user.id})
+    res = await db.targets.delete_one({"endpoint": endpoint, "user_id": user.id})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Target not found or not owned by you")
         
     # Regenerate file
-    _regenerate_targets_file(db)
+    await invalidate_cached_responses(user.id)
+    await _await_targets_write()
     
     logger.info(f"[Targets] User {user.username} removed target: {endpoint}")
     
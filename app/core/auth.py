@@ -3,39 +3,126 @@ Authentication Utilities
 JWT token generation, validation, and password hashing
 """
 import os
+import asyncio
+import hashlib
+import hmac
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Annotated, Optional, Tuple
 
 import jwt
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from fastapi import Depends, HTTPException, status
+from jwt.algorithms import HMACAlgorithm
+from cachetools import TTLCache
+from argon2 import PasswordHasher, Type, extract_parameters
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from argon2.low_level import ARGON2_VERSION
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from bson import ObjectId
 
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import get_async_db
 from app.schemas.user import User, TokenData
 from app.core.logging import logger
 
-# Password hashing with Argon2 (Production-grade settings)
+# Password hashing with Argon2id (Production-grade settings).
+# Stored hashes with weaker parameters are upgraded on the next successful login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))          # Number of iterations (production: 3-4)
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # Memory usage in KiB (production: 65536)
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))      # Number of parallel lanes (production: 4)
 ph = PasswordHasher(
-    time_cost=3,        # Number of iterations (production: 3-4)
-    memory_cost=65536,  # Memory usage in KiB (production: 65536)
-    parallelism=4       # Number of parallel threads (production: 4)
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+    hash_len=32,
+    type=Type.ID,
 )
 
+# Password hashing runs in a process pool so concurrent Argon2 working sets
+# (64 MiB each) stay out of the request process; submissions are capped.
+KDF_WORKERS = int(os.getenv("KDF_WORKERS", str(os.cpu_count() or 1)))
+_kdf_pool: Optional[ProcessPoolExecutor] = None
+_kdf_slots: Optional[asyncio.BoundedSemaphore] = None
+
 # JWT settings
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production")
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production").encode()
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
+
+class _PreparedHMAC(HMACAlgorithm):
+    """
+    HS256 with SECRET_KEY validated and keyed once: PyJWT otherwise re-checks the
+    key (PEM/SSH/DER/JWK probes) and rebuilds the HMAC pads on every encode/decode.
+    Any other key falls through to the stock implementation.
+    """
+
+    def __init__(self, key: bytes):
+        super().__init__(HMACAlgorithm.SHA256)
+        self._key = super().prepare_key(key)
+        self._mac = hmac.new(self._key, digestmod=self.hash_alg)
+
+    def prepare_key(self, key):
+        return key if key is self._key else super().prepare_key(key)
+
+    def sign(self, msg: bytes, key: bytes) -> bytes:
+        if key is not self._key:
+            return super().sign(msg, key)
+        mac = self._mac.copy()
+        mac.update(msg)
+        return mac.digest()
+
+
+# Replaces the default HS256 implementation for the process-wide jwt.encode/decode
+jwt.unregister_algorithm(ALGORITHM)
+jwt.register_algorithm(ALGORITHM, _PreparedHMAC(SECRET_KEY))
+
 # Security scheme
 security = HTTPBearer()
+security_optional = HTTPBearer(auto_error=False)
 
+# Verified access tokens: blake2b(token) -> (TokenData, exp). Failures are never cached;
+# entries past their exp claim are dropped on read. Sync dependencies run in the
+# threadpool, hence the lock.
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+_token_cache_lock = threading.Lock()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its Argon2 hash"""
+# Authenticated users by id, so hot paths skip the users lookup (see invalidate_user).
+# Only touched from the event loop, so no lock; the TTL bounds staleness in other workers.
+USER_CACHE_TTL = 30
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_USER_PROJECTION = {"username": 1, "email": 1, "active": 1}
+
+
+def start_kdf_pool():
+    """Start the password hashing process pool (called at startup)"""
+    global _kdf_pool, _kdf_slots
+    if _kdf_pool is None:
+        _kdf_pool = ProcessPoolExecutor(max_workers=KDF_WORKERS)
+        _kdf_slots = asyncio.BoundedSemaphore(2 * KDF_WORKERS)
+        logger.info(f"[Auth] KDF pool started ({KDF_WORKERS} workers)")
+
+
+def shutdown_kdf_pool():
+    """Stop the password hashing process pool (called at shutdown)"""
+    global _kdf_pool, _kdf_slots
+    if _kdf_pool is not None:
+        _kdf_pool.shutdown(wait=False, cancel_futures=True)
+        _kdf_pool = None
+        _kdf_slots = None
+
+
+async def _run_kdf(func, *args):
+    """Run a hashing function in the KDF pool, or a thread if the pool is not started"""
+    if _kdf_pool is None:
+        return await asyncio.to_thread(func, *args)
+    async with _kdf_slots:
+        return await asyncio.get_running_loop().run_in_executor(_kdf_pool, func, *args)
+
+
+def _verify_password_sync(plain_password: str, hashed_password: str) -> bool:
     try:
         ph.verify(hashed_password, plain_password)
         return True
@@ -43,11 +130,57 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def get_password_hash(password: str) -> str:
-    """Hash a password using Argon2"""
+def _hash_password_sync(password: str) -> str:
     return ph.hash(password)
 
 
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its Argon2 hash (off the event loop)"""
+    return await _run_kdf(_verify_password_sync, plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    """Hash a password using Argon2id (off the event loop)"""
+    return await _run_kdf(_hash_password_sync, password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    True if the hash is weaker than the current parameters (cheap, no KDF).
+    Hashes at or above them on every field are kept, so lowering the configured
+    cost never rewrites stronger hashes downwards.
+    """
+    try:
+        stored = extract_parameters(hashed_password)
+    except InvalidHashError:
+        return False
+    if stored.type is not Type.ID or stored.version < ARGON2_VERSION:
+        return True
+    return any(
+        getattr(stored, field) < getattr(ph, field)
+        for field in ("time_cost", "memory_cost", "parallelism", "hash_len", "salt_len")
+    )
+
+
+async def rehash_password(user_id: str, plain_password: str, old_hash: str):
+    """
+    Store a fresh hash with the current parameters (run after a successful login).
+    Matching on the old hash keeps a concurrent password change from being overwritten.
+    """
+    try:
+        new_hash = await get_password_hash(plain_password)
+        db = await get_async_db()
+        if db is None:
+            return
+        await db.users.update_one(
+            {"_id": ObjectId(user_id), "password_hash": old_hash},
+            {"$set": {"password_hash": new_hash}}
+        )
+        logger.info(f"[Auth] Password hash upgraded for user {user_id}")
+    except Exception as e:
+        logger.warning(f"[Auth] Password rehash failed for user {user_id}: {e}")
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -108,7 +241,7 @@ def decode_refresh_token(token: str) -> dict:
             detail="Refresh token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate refresh token",
@@ -117,7 +250,26 @@ def decode_refresh_token(token: str) -> dict:
 
 
 def decode_access_token(token: str) -> TokenData:
-    """Decode and validate JWT token"""
+    """Decode and validate JWT token (verified tokens are cached until their exp)"""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None:
+        token_data, exp = cached
+        if exp > time.time():
+            return token_data
+        with _token_cache_lock:
+            _token_cache.pop(key, None)
+
+    token_data, exp = _decode_access_token(token)
+    if exp is not None:
+        with _token_cache_lock:
+            _token_cache[key] = (token_data, exp)
+    return token_data
+
+
+def _decode_access_token(token: str) -> Tuple[TokenData, Optional[float]]:
+    """Verify the signature and claims; returns (TokenData, exp timestamp)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("user_id")
@@ -130,7 +282,7 @@ def decode_access_token(token: str) -> TokenData:
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        return TokenData(user_id=user_id, username=username)
+        return TokenData(user_id=user_id, username=username), payload.get("exp")
     
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -138,7 +290,7 @@ def decode_access_token(token: str) -> TokenData:
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -146,17 +298,13 @@ def decode_access_token(token: str) -> TokenData:
         )
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-) -> User:
-    """
-    Dependency to get current authenticated user.
-    Use this in route dependencies: user: User = Depends(get_current_user)
-    """
-    token = credentials.credentials
-    token_data = decode_access_token(token)
-    
-    db = get_db()
+async def get_user_by_id(user_id: str) -> Optional[User]:
+    """Look up a user by id, served from a short-TTL cache; None if the user does not exist"""
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    db = await get_async_db()
     if db is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -164,7 +312,7 @@ async def get_current_user(
         )
     
     try:
-        user_doc = db.users.find_one({"_id": ObjectId(token_data.user_id)})
+        user_doc = await db.users.find_one({"_id": ObjectId(user_id)}, _USER_PROJECTION)
     except Exception as e:
         logger.error(f"[Auth] Error fetching user: {e}")
         raise HTTPException(
@@ -173,27 +321,62 @@ async def get_current_user(
         )
     
     if not user_doc:
+        return None
+    
+    user = User(
+        id=str(user_doc["_id"]),
+        username=user_doc["username"],
+        email=user_doc["email"],
+        active=user_doc.get("active", True)
+    )
+    _user_cache[user_id] = user
+    return user
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached user (call on logout, session revocation or account changes)"""
+    _user_cache.pop(user_id, None)
+
+
+def get_token_data(request: Request, credentials: HTTPAuthorizationCredentials) -> TokenData:
+    """Decode the access token once per request; later callers reuse request.state.jwt_payload"""
+    token_data = getattr(request.state, "jwt_payload", None)
+    if token_data is None:
+        token_data = decode_access_token(credentials.credentials)
+        request.state.jwt_payload = token_data
+    return token_data
+
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> User:
+    """
+    Dependency to get current authenticated user.
+    Use this in route dependencies: user: CurrentUser
+    """
+    token_data = get_token_data(request, credentials)
+    
+    user = await get_user_by_id(token_data.user_id)
+    
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    if not user_doc.get("active", True):
+    if not user.active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
         )
     
-    return User(
-        id=str(user_doc["_id"]),
-        username=user_doc["username"],
-        email=user_doc["email"],
-        active=user_doc.get("active", True)
-    )
+    return user
 
 
 async def get_current_user_optional(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optional)
 ) -> Optional[User]:
     """
     Optional authentication - returns None if no token provided.
@@ -203,6 +386,10 @@ async def get_current_user_optional(
         return None
     
     try:
-        return await get_current_user(credentials)
+        return await get_current_user(request, credentials)
     except HTTPException:
         return None
+
+
+# Route parameter type for the authenticated user (resolved once per request)
+CurrentUser = Annotated[User, Depends(get_current_user, use_cache=True)]
@@ -0,0 +1,90 @@
+"""
+Response Cache
+Cache-aside for read-heavy GET routes, stored in Redis (or the in-process fallback).
+
+Keys are `resp:{owner}:{route}:{params}` where owner is the user id (or "public"
+for unauthenticated routes), so one prefix delete drops everything a user can see.
+"""
+import functools
+from typing import Optional
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from app.core.helpers import etag_matches
+from app.core.logging import logger
+from app.core.responses import ORJSONResponse
+from app.services.redis_service import cache_delete_prefix, cache_get_bytes, cache_set_bytes
+
+STATS_CACHE_TTL = 10
+LIST_CACHE_TTL = 15
+GRAFANA_CACHE_TTL = 60
+
+PUBLIC_OWNER = "public"
+
+# Larger bodies (e.g. big pages with full metrics arrays) are served but not cached
+CACHE_MAX_BODY_BYTES = 1024 * 1024
+
+# Params that identify the caller rather than the query
+_SKIP_PARAMS = {"user", "request"}
+
+cache_counters = {"hit": 0, "miss": 0}
+
+
+def _cache_key(route: str, owner: str, params: dict) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.items()) if k not in _SKIP_PARAMS)
+    return f"resp:{owner}:{route}:{query}"
+
+
+def cached_response(ttl: int):
+    """
+    Cache a route's JSON body for ttl seconds.
+    The authenticated user must be passed as the `user` parameter; without one the
+    entry is shared under PUBLIC_OWNER. Only buffered 200 responses up to
+    CACHE_MAX_BODY_BYTES are stored.
+    A route's ETag header is stored with the body; when the route also takes
+    `request`, a matching If-None-Match is answered 304 straight from the cache.
+    """
+    def decorator(func):
+        route = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            user = kwargs.get("user")
+            owner = user.id if user is not None else PUBLIC_OWNER
+            key = _cache_key(route, owner, kwargs)
+
+            raw = await cache_get_bytes(key)
+            if raw is not None:
+                cache_counters["hit"] += 1
+                logger.debug(f"[Cache] cache_hit {route} (hits={cache_counters['hit']})")
+                etag, _, body = raw.partition(b"\n")
+                if not etag:
+                    return Response(content=body, media_type="application/json")
+                headers = {"ETag": etag.decode()}
+                request = kwargs.get("request")
+                if request is not None and etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+                    return Response(status_code=304, headers=headers)
+                return Response(content=body, media_type="application/json", headers=headers)
+
+            cache_counters["miss"] += 1
+            logger.debug(f"[Cache] cache_miss {route} (misses={cache_counters['miss']})")
+
+            result = await func(*args, **kwargs)
+            if isinstance(result, StreamingResponse):
+                return result
+            if not isinstance(result, Response):
+                result = ORJSONResponse(result)
+            if result.status_code == 200 and len(result.body) <= CACHE_MAX_BODY_BYTES:
+                # stored as b"<etag>\n<body>"; ETags never contain a newline
+                etag = result.headers.get("etag", "").encode()
+                await cache_set_bytes(key, etag + b"\n" + bytes(result.body), ttl)
+            return result
+
+        return wrapper
+    return decorator
+
+
+async def invalidate_cached_responses(user_id: Optional[str] = None):
+    """Drop cached responses for a user (or the shared public entries)"""
+    await cache_delete_prefix(f"resp:{user_id or PUBLIC_OWNER}:")
@@ -14,6 +14,17 @@ PROM_URL = os.getenv("PROM_URL", "http://localhost:9090")
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB", "observability")
 MAX_DOCS = int(os.getenv("MAX_DOCS", "1000"))
+# Connection pool (per client) and wire compression (zstd needs the zstandard package)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "500"))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,zlib").strip()
+
+# Default executor for run_in_executor(None, ...) / asyncio.to_thread (blocking SMTP, Slack, file calls)
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "32"))
+
+# Redis (optional; shared cache/task status across workers, in-process fallback if unset)
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
 
 # OpenAI (Primary LLM)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
@@ -30,6 +41,8 @@ MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", "1800"))
 # If your Prometheus returns thousands of series, we cap what we send to the LLM.
 BATCH_MAX_METRICS = int(os.getenv("BATCH_MAX_METRICS", "600"))
 BATCH_INTERVAL_MINUTES = int(os.getenv("BATCH_INTERVAL_MINUTES", "2"))
+# Users whose batch windows may be analyzed at the same time (Prometheus + LLM load)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
 # Maximum metrics per instance (for better prompt organization)
 BATCH_METRICS_PER_INSTANCE = int(os.getenv("BATCH_METRICS_PER_INSTANCE", "200"))
 
@@ -42,7 +55,8 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 _emails = os.getenv("ALERT_EMAILS", "") or os.getenv("ALERT_EMAIL", "")
-ALERT_EMAILS = [e.strip() for e in _emails.split(",") if e.strip()]
+# Normalized once: trimmed, lowercased, de-duplicated (first occurrence wins)
+ALERT_EMAILS = tuple(dict.fromkeys(e.strip().lower() for e in _emails.split(",") if e.strip()))
 
 # Slack (Incoming Webhook)
 SLACK_ENABLED = os.getenv("SLACK_ENABLED", "false").strip().lower() in ("1", "true", "yes", "y", "on")
@@ -1,16 +1,30 @@
 """
 Helper Utility Functions
 """
+import hashlib
 import json
+from typing import Optional
+
+import orjson
 
 
 def parse_json(text: str) -> dict:
     """
     Parse JSON from text, even if embedded in other text
     """
+    # find/rfind stop at the first/last brace, so clean JSON costs O(1) here
+    s, e = text.find("{"), text.rfind("}") + 1
+    if s == -1 or e <= s:
+        return {}
+    # parse the string itself when it is exactly the object (no slice copy)
+    raw = text if s == 0 and e == len(text) else text[s:e]
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        pass
     try:
-        s, e = text.find("{"), text.rfind("}") + 1
-        return json.loads(text[s:e]) if s != -1 and e > s else {}
+        # orjson is strict; models sometimes emit NaN/Infinity, which the stdlib accepts
+        return json.loads(raw)
     except Exception:
         return {}
 
@@ -22,3 +36,22 @@ def mask_webhook(url: str) -> str:
     if not url:
         return ""
     return url[:30] + "..." + url[-8:] if len(url) > 45 else "***"
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong HTTP ETag (quoted) from the values that determine a response
+    """
+    key = ":".join(str(p) for p in parts).encode()
+    return '"' + hashlib.blake2b(key, digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header value against an ETag (weak comparison)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
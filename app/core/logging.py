@@ -1,10 +1,15 @@
 """
 Logging Configuration
-Multi-file logging handler for different log levels
+Multi-file logging handler for different log levels.
+Records are queued by the caller and written to the files and stdout on a
+background listener thread, so request code never blocks on log I/O.
 """
 import io
 import sys
+import atexit
+import queue
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
 
 class MultiFileHandler(logging.Handler):
@@ -15,7 +20,8 @@ class MultiFileHandler(logging.Handler):
         self.error_handler = logging.FileHandler("error.log", encoding="utf-8")
         self.error_handler.setLevel(logging.ERROR)
 
-        self.debug_handler = logging.FileHandler("debug.log", encoding="utf-8")
+        # delay: not created until a DEBUG record arrives (the root level is INFO)
+        self.debug_handler = logging.FileHandler("debug.log", encoding="utf-8", delay=True)
         self.debug_handler.setLevel(logging.DEBUG)
 
         self.info_handler = logging.FileHandler("app.log", encoding="utf-8")
@@ -27,8 +33,11 @@ class MultiFileHandler(logging.Handler):
         self.info_handler.setFormatter(formatter)
 
     def emit(self, record):
-        self.info_handler.emit(record)
-        self.debug_handler.emit(record)
+        # app.log and debug.log are disjoint; each record is written once outside error.log
+        if record.levelno >= logging.INFO:
+            self.info_handler.emit(record)
+        else:
+            self.debug_handler.emit(record)
         if record.levelno >= logging.ERROR:
             self.error_handler.emit(record)
 
@@ -36,14 +45,17 @@ class MultiFileHandler(logging.Handler):
 def setup_logger():
     """Configure and return application logger"""
     utf8_stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", line_buffering=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            MultiFileHandler(),
-            logging.StreamHandler(utf8_stdout),
-        ],
-    )
+    stream_handler = logging.StreamHandler(utf8_stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, MultiFileHandler(), stream_handler)
+    listener.start()
+    atexit.register(listener.stop)  # drains the queue before exit
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # the listener's handlers add the prefix
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
     return logging.getLogger(__name__)
 
 
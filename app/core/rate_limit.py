@@ -7,18 +7,31 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi import Request, Response
+from fastapi.responses import PlainTextResponse
 from app.core.logging import logger
 
+# Counter storage: memory:// is per-process; point at Redis (e.g. redis://localhost:6379/1)
+# so limits are shared across uvicorn workers and checked atomically server-side
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "moving-window")
+
 # Initialize rate limiter
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["100/minute"],
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+    # Keep limiting in-process if the shared store is unreachable
+    in_memory_fallback_enabled=not RATE_LIMIT_STORAGE_URI.startswith("memory://"),
     enabled=os.getenv("ENABLE_RATE_LIMITING", "true").lower() == "true"
 )
 
 # Rate limit configurations
 AUTH_RATE_LIMIT = os.getenv("AUTH_RATE_LIMIT", "5/minute")
 API_RATE_LIMIT = os.getenv("API_RATE_LIMIT", "100/minute")
+TEST_ALERT_RATE_LIMIT = os.getenv("TEST_ALERT_RATE_LIMIT", "5/minute")
+
+_RATE_LIMIT_MESSAGE = b"Rate limit exceeded. Please try again in "
 
 
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> Response:
@@ -28,8 +41,9 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded)
     client_ip = get_remote_address(request)
     logger.warning(f"[RateLimit] Rate limit exceeded for {client_ip} on {request.url.path}")
     
-    return Response(
-        content=f"Rate limit exceeded. Please try again in {exc.detail}",
+    detail = str(exc.detail)
+    return PlainTextResponse(
+        content=_RATE_LIMIT_MESSAGE + detail.encode(),
         status_code=429,
-        headers={"Retry-After": str(exc.detail)}
+        headers={"Retry-After": detail}
     )
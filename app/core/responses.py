@@ -0,0 +1,34 @@
+"""
+Response Classes
+orjson-backed JSON rendering for the large list endpoints
+"""
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson can't encode natively (datetime is native)"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def orjson_dumps(content: Any) -> bytes:
+    """Serialize with the same options as ORJSONResponse (used for streamed rows)"""
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered by orjson in a single C-level pass.
+    ObjectIds become strings; datetimes are ISO 8601, with naive (Mongo-decoded) values marked UTC.
+    Return it directly from a route to also skip FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson_dumps(content)
@@ -2,31 +2,81 @@
 Session Management Utilities
 Track and manage user sessions across devices
 """
+import asyncio
+import base64
+import os
+from functools import lru_cache
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from bson import ObjectId
-import secrets
+from fastapi import Depends, Request
+from pymongo import UpdateOne
 from user_agents import parse
 
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import get_async_db
+from app.core.auth import CurrentUser, invalidate_user
 from app.core.logging import logger
 from app.core.time import now_ist, format_ist
 
 
-def create_session(user_id: str, ip_address: str, user_agent: str) -> str:
+# last_active bumps are buffered per process and flushed in one bulk write
+# (trades a few seconds of precision for one write per session per interval).
+# Only touched from the event loop, so no lock.
+SESSION_ACTIVITY_FLUSH_SECONDS = 30
+_pending_last_active: Dict[str, datetime] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+# Session ids are sliced from a pool of OS random bytes, one urandom read per
+# SESSION_ID_POOL_BYTES // SESSION_ID_BYTES sessions. Event loop only, so no lock.
+SESSION_ID_BYTES = 32
+SESSION_ID_POOL_BYTES = 4096
+_session_id_pool = bytearray()
+
+# Fields returned by get_user_sessions (what the sessions UI shows); the raw
+# user_agent is left out, the parsed device covers it
+SESSION_LIST_LIMIT = 100
+SESSION_LIST_PROJECTION = {
+    "_id": 0,
+    "session_id": 1,
+    "device": 1,
+    "ip_address": 1,
+    "created_at_str": 1,
+    "last_active_str": 1,
+}
+
+
+@lru_cache(maxsize=2048)
+def _parse_device(user_agent: str) -> Tuple[str, str, str, str, str]:
+    """(browser, browser_version, os, os_version, device_type); browsers send few distinct UAs"""
+    ua = parse(user_agent)
+    device_type = "mobile" if ua.is_mobile else "tablet" if ua.is_tablet else "desktop"
+    return ua.browser.family, ua.browser.version_string, ua.os.family, ua.os.version_string, device_type
+
+
+def _new_session_id() -> str:
+    """URL-safe random session id (same format as secrets.token_urlsafe(SESSION_ID_BYTES))"""
+    if len(_session_id_pool) < SESSION_ID_BYTES:
+        _session_id_pool.extend(os.urandom(SESSION_ID_POOL_BYTES))
+    raw = bytes(_session_id_pool[:SESSION_ID_BYTES])
+    del _session_id_pool[:SESSION_ID_BYTES]
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+async def create_session(user_id: str, ip_address: str, user_agent: str) -> str:
     """
     Create a new session for a user
     Returns session_id
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         raise Exception("Database unavailable")
     
     # Parse user agent to get device info
-    ua = parse(user_agent)
+    browser, browser_version, os_family, os_version, device_type = _parse_device(user_agent)
     
-    session_id = secrets.token_urlsafe(32)
+    session_id = _new_session_id()
     created_at = now_ist()
+    created_at_str = format_ist(created_at, include_tz=True)
     
     session_doc = {
         "session_id": session_id,
@@ -34,81 +84,136 @@ def create_session(user_id: str, ip_address: str, user_agent: str) -> str:
         "ip_address": ip_address,
         "user_agent": user_agent,
         "device": {
-            "browser": ua.browser.family,
-            "browser_version": ua.browser.version_string,
-            "os": ua.os.family,
-            "os_version": ua.os.version_string,
-            "device_type": "mobile" if ua.is_mobile else "tablet" if ua.is_tablet else "desktop"
+            "browser": browser,
+            "browser_version": browser_version,
+            "os": os_family,
+            "os_version": os_version,
+            "device_type": device_type
         },
         "created_at": created_at,
-        "created_at_str": format_ist(created_at, include_tz=True),
+        "created_at_str": created_at_str,
         "last_active": created_at,
-        "last_active_str": format_ist(created_at, include_tz=True),
+        "last_active_str": created_at_str,
         "active": True
     }
     
-    db.sessions.insert_one(session_doc)
+    await db.sessions.insert_one(session_doc)
     logger.info(f"[Session] Created session {session_id} for user {user_id}")
     
     return session_id
 
 
-def validate_session(session_id: str, user_id: str) -> bool:
+async def validate_session(session_id: str, user_id: str) -> bool:
     """
     Validate that a session exists and is active
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return False
     
-    session = db.sessions.find_one({
-        "session_id": session_id,
-        "user_id": user_id,
-        "active": True
-    })
-    
-    if session:
-        # Update last active time
-        db.sessions.update_one(
-            {"session_id": session_id},
-            {
-                "$set": {
-                    "last_active": now_ist(),
-                    "last_active_str": format_ist(now_ist(), include_tz=True)
-                }
-            }
-        )
+    # Existence check only; the unique session_id index makes this a single key lookup
+    session = await db.sessions.find_one(
+        {"session_id": session_id, "user_id": user_id, "active": True},
+        {"_id": 1},
+    )
+    
+    if session is not None:
+        # Last active time is written in batches by the activity flusher
+        _pending_last_active[session_id] = now_ist()
         return True
     
     return False
 
 
-def revoke_session(session_id: str, user_id: str) -> bool:
+async def flush_session_activity():
+    """Write buffered last_active times in one bulk update"""
+    if not _pending_last_active:
+        return
+    # Snapshot and clear without awaiting in between, so no validate can slip through
+    batch = dict(_pending_last_active)
+    _pending_last_active.clear()
+
+    db = await get_async_db()
+    if db is None:
+        return
+
+    ops = [
+        UpdateOne(
+            {"session_id": sid},
+            {"$set": {"last_active": ts, "last_active_str": format_ist(ts, include_tz=True)}},
+        )
+        for sid, ts in batch.items()
+    ]
+    try:
+        await db.sessions.bulk_write(ops, ordered=False)
+        logger.debug(f"[Session] Flushed last_active for {len(ops)} sessions")
+    except Exception as e:
+        logger.error(f"[Session] Failed to flush session activity: {e}")
+
+
+async def _activity_flusher():
+    while True:
+        await asyncio.sleep(SESSION_ACTIVITY_FLUSH_SECONDS)
+        await flush_session_activity()
+
+
+def start_session_activity_flusher():
+    """Start the periodic last_active flush (called at startup)"""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_activity_flusher())
+
+
+async def stop_session_activity_flusher():
+    """Stop the periodic flush and write what is still buffered (called at shutdown)"""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await flush_session_activity()
+
+
+def _revoked_fields() -> Dict:
+    """$set payload marking a session revoked, with when it happened"""
+    revoked_at = now_ist()
+    return {
+        "active": False,
+        "revoked_at": revoked_at,
+        "revoked_at_str": format_ist(revoked_at, include_tz=True),
+    }
+
+
+async def revoke_session(session_id: str, user_id: str) -> bool:
     """
     Revoke a specific session
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return False
     
-    result = db.sessions.update_one(
+    result = await db.sessions.update_one(
         {"session_id": session_id, "user_id": user_id},
-        {"$set": {"active": False}}
+        {"$set": _revoked_fields()}
     )
     
     if result.modified_count > 0:
+        invalidate_user(user_id)
         logger.info(f"[Session] Revoked session {session_id} for user {user_id}")
         return True
     
     return False
 
 
-def revoke_all_sessions(user_id: str, except_session_id: Optional[str] = None) -> int:
+async def revoke_all_sessions(user_id: str, except_session_id: Optional[str] = None) -> int:
     """
     Revoke all sessions for a user, optionally except one
     Returns number of sessions revoked
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
         return 0
     
@@ -116,52 +221,67 @@ def revoke_all_sessions(user_id: str, except_session_id: Optional[str] = None) -
     if except_session_id:
         query["session_id"] = {"$ne": except_session_id}
     
-    result = db.sessions.update_many(
+    # One server-side update for every matching session
+    result = await db.sessions.update_many(
         query,
-        {"$set": {"active": False}}
+        {"$set": _revoked_fields()}
     )
     
+    invalidate_user(user_id)
     logger.info(f"[Session] Revoked {result.modified_count} sessions for user {user_id}")
     return result.modified_count
 
 
-def get_user_sessions(user_id: str, include_inactive: bool = False) -> List[Dict]:
+async def find_session_by_fingerprint(user_id: str, ip_address: str, user_agent: str) -> Optional[str]:
     """
-    Get all sessions for a user
+    Find the most recently active session matching a client's IP and user agent
+    Returns session_id or None
     """
-    db = get_db()
+    db = await get_async_db()
     if db is None:
-        return []
-    
-    query = {"user_id": user_id}
-    if not include_inactive:
-        query["active"] = True
-    
-    sessions = list(db.sessions.find(query).sort("last_active", -1))
+        return None
     
-    # Convert ObjectId to string and format for response
-    for session in sessions:
-        session["_id"] = str(session["_id"])
-    
-    return sessions
+    session = await db.sessions.find_one(
+        {"user_id": user_id, "ip_address": ip_address, "user_agent": user_agent, "active": True},
+        {"session_id": 1, "_id": 0},
+        sort=[("last_active", -1)],
+    )
+    return session["session_id"] if session else None
+
+
+def get_fingerprint(request: Request) -> Tuple[str, str]:
+    """
+    Dependency: the client's (ip_address, user_agent) pair, as stored on sessions
+    """
+    ip_address = request.client.host if request.client else "unknown"
+    user_agent = request.headers.get("user-agent", "unknown")
+    return ip_address, user_agent
 
 
-def cleanup_expired_sessions(days: int = 30) -> int:
+async def get_current_session_id(
+    user: CurrentUser,
+    fingerprint: Tuple[str, str] = Depends(get_fingerprint),
+) -> Optional[str]:
     """
-    Remove sessions older than specified days
+    Dependency: session_id of the caller's current session, if one matches
     """
-    db = get_db()
+    return await find_session_by_fingerprint(user.id, *fingerprint)
+
+
+async def get_user_sessions(user_id: str, include_inactive: bool = False,
+                            limit: int = SESSION_LIST_LIMIT) -> List[Dict]:
+    """
+    Get a user's sessions, most recently active first (at most limit)
+    """
+    db = await get_async_db()
     if db is None:
-        return 0
-    
-    from datetime import timedelta
-    cutoff_date = now_ist() - timedelta(days=days)
+        return []
     
-    result = db.sessions.delete_many({
-        "last_active": {"$lt": cutoff_date}
-    })
+    query = {"user_id": user_id}
+    if not include_inactive:
+        query["active"] = True
     
-    if result.deleted_count > 0:
-        logger.info(f"[Session] Cleaned up {result.deleted_count} expired sessions")
+    sessions = await db.sessions.find(query, SESSION_LIST_PROJECTION).sort("last_active", -1).limit(limit).to_list(None)
     
-    return result.deleted_count
+    return sessions
+
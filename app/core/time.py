@@ -19,10 +19,12 @@ def ist_to_utc(dt: datetime) -> datetime:
         dt = dt.replace(tzinfo=IST)
     return dt.astimezone(timezone.utc)
 
+_FMT_TZ = "%Y-%m-%d %H:%M:%S IST"
+_FMT_NOTZ = "%Y-%m-%d %H:%M:%S"
+
 def format_ist(dt: datetime, include_tz: bool = True) -> str:
-    """Format datetime in IST"""
-    ist_dt = utc_to_ist(dt) if dt.tzinfo == timezone.utc else dt
-    fmt = "%Y-%m-%d %H:%M:%S"
-    if include_tz:
-        return ist_dt.strftime(fmt) + " IST"
-    return ist_dt.strftime(fmt)
+    """Format datetime in IST (naive datetimes are assumed to be IST already)"""
+    # astimezone returns dt itself when it is already IST, e.g. now_ist() output
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(IST)
+    return dt.strftime(_FMT_TZ if include_tz else _FMT_NOTZ)
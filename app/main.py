@@ -1,22 +1,36 @@
 import asyncio
+import hashlib
 import os
-import json
+import orjson
+import random
 import uvicorn
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from itertools import chain
 from typing import Dict, Any, List, Tuple, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
-from app.core.config import PROM_URL, BATCH_INTERVAL_MINUTES, MONGO_URI
+from app.core.config import (
+    PROM_URL, BATCH_INTERVAL_MINUTES, BATCH_MAX_CONCURRENCY, BATCH_METRICS_PER_INSTANCE, MONGO_URI, THREAD_POOL_SIZE,
+)
 from app.core.logging import logger
-from app.core.time import now_ist, ist_to_utc, format_ist
+from app.core.time import IST, now_ist, format_ist
 from app.core.helpers import parse_json
 from app.core.rate_limit import limiter, rate_limit_exceeded_handler
+from app.core.auth import start_kdf_pool, shutdown_kdf_pool
+from app.core.responses import ORJSONResponse
 
 from app.services.langfuse_service import (
     initialize_langfuse, is_langfuse_enabled,
@@ -26,13 +40,19 @@ from app.services.slack_service import send_slack_alert_text, slack_is_configure
 from app.services.email_service import send_alert
 
 # ✅ updated: use db.py helpers
-from app.services.mongodb_service import get_db, parse_instance, build_source, looks_like_instance
+from app.services.mongodb_service import (
+    get_db, get_async_db, close_mongo, ensure_indexes, parse_instance, build_source, looks_like_instance,
+    SORT_TS_FIELD,
+)
 
-from app.services.prometheus_service import fetch_metrics
-from app.services.llm_service import ask_llm
+from app.services.prometheus_service import fetch_metrics, fetch_metrics_for_user, close_prometheus_client
+from app.services.llm_service import ask_llm_async, close_llm_clients
+from app.services.redis_service import init_redis, close_redis
 from app.services.session_service import session_manager
 
 from app.api.router import api_router
+from app.api.endpoints.target import start_targets_writer, stop_targets_writer
+from app.core.session import start_session_activity_flusher, stop_session_activity_flusher
 
 try:
     from langfuse import propagate_attributes
@@ -40,6 +60,43 @@ except ImportError:
     propagate_attributes = None
 
 
+# Response schema shown to the LLM; rendered once, it never changes between ticks
+BATCH_SCHEMA = {
+    "incident": {
+        "title": "string", "severity": "low|medium|high|critical",
+        "confidence": 0.0, "summary": "string", "root_cause": "string",
+        "contributing_factors": [], "blast_radius": "string",
+        "evidence": [{"metric": "", "instance": "", "value": 0, "why_it_matters": ""}],
+        "fix_plan": {"immediate": [], "next_24h": [], "prevention": []}
+    },
+    "anomalies": [{"metric": "", "instance": "", "observed": 0, "expected": "", "symptom": "", "cluster": ""}],
+    "clusters": [{"name": "", "theme": "", "anomaly_indexes": []}]
+}
+BATCH_SCHEMA_JSON = orjson.dumps(BATCH_SCHEMA, option=orjson.OPT_INDENT_2).decode()
+
+
+# Alert delivery (sync Mongo lookups, SMTP, Slack) runs here, apart from the default executor
+_ALERT_EXEC = ThreadPoolExecutor(max_workers=4, thread_name_prefix="alerts")
+
+
+@lru_cache(maxsize=4)
+def _batch_window(start_utc: datetime, interval: int) -> Tuple[datetime, datetime, str]:
+    """
+    IST bounds and base session ID for a UTC window start.
+    Every user's monitor asks for the same window in a tick, so it's converted once.
+    """
+    end_utc = start_utc + timedelta(minutes=interval)
+    session_id = make_batch_session_id(start_utc, interval, "batch")
+    return start_utc.astimezone(IST), end_utc.astimezone(IST), session_id
+
+
+def batch_window(at: datetime, interval: int) -> Tuple[datetime, datetime, str]:
+    """IST window containing `at` (aware), with its base session ID (no user suffix)."""
+    # Bucketed in UTC so the window matches the session ID's UTC buckets
+    start_utc, _ = make_batch_window(at.astimezone(timezone.utc), interval)
+    return _batch_window(start_utc, interval)
+
+
 class BatchMonitor:
     """Handles batch metric analysis with LLM-based anomaly detection"""
 
@@ -47,107 +104,128 @@ class BatchMonitor:
         self.interval = interval_minutes
         self.max_metrics = int(os.getenv("BATCH_MAX_METRICS", "600"))
         self.user_id = user_id  # User ID for multi-user support
-        self._task: Optional[asyncio.Task] = None
-
-    def get_window(self) -> Tuple[datetime, datetime]:
-        """Calculate current batch window in IST."""
-        current_ist = now_ist()
-        current_utc = ist_to_utc(current_ist)
-        start_utc, end_utc = make_batch_window(current_utc.replace(tzinfo=None), self.interval)
-
-        # Convert back to IST aware
-        start_ist = start_utc.replace(tzinfo=datetime.utcnow().astimezone().tzinfo).astimezone(current_ist.tzinfo)
-        end_ist = end_utc.replace(tzinfo=datetime.utcnow().astimezone().tzinfo).astimezone(current_ist.tzinfo)
-        return start_ist, end_ist
-
-    def get_session_id(self, window_start: datetime) -> str:
-        """Generate Langfuse session ID for batch (expects naive UTC)."""
-        utc_start = ist_to_utc(window_start).replace(tzinfo=None)
-        session_id = make_batch_session_id(utc_start, self.interval, "batch")
+        self._window_key: Tuple[Optional[Tuple[datetime, datetime]], Dict[str, str]] = (None, {})
+        # Fingerprint of the last analyzed metrics, and its incident id when severity was low
+        self._last_key: Optional[bytes] = None
+        self._last_low_incident_id: Any = None
+
+    def get_window(self, window: Optional[Tuple[datetime, datetime, str]] = None) -> Tuple[datetime, datetime, str]:
+        """
+        This user's batch window in IST, with its Langfuse session ID.
+        `window` is a batch_window() result fixed by the caller; defaults to the current window.
+        """
+        start, end, session_id = window or batch_window(datetime.now(timezone.utc), self.interval)
         # Add user_id to session for multi-user tracking
         if self.user_id:
             session_id = f"{session_id}_user_{self.user_id}"
-        return session_id
-
-    def is_processed(self, db, start: datetime, end: datetime) -> bool:
-        """Check if window already processed for this user."""
-        if db is None:
-            return False
+        return start, end, session_id
+
+    def _window_filter(self, start: datetime, end: datetime) -> Dict[str, str]:
+        """
+        alert_windows key for this user's window.
+        Formatted once per window and reused by claim, prompt, storage and mark_processed
+        (callers must not mutate it).
+        """
+        if self._window_key[0] == (start, end):
+            return self._window_key[1]
         query = {
             "window_start_ist_str": format_ist(start, include_tz=True),
-            "window_end_ist_str": format_ist(end, include_tz=True)
+            "window_end_ist_str": format_ist(end, include_tz=True),
         }
         # Add user_id filter for multi-user
         if self.user_id:
             query["user_id"] = self.user_id
-        return db.alert_windows.find_one(query) is not None
+        self._window_key = ((start, end), query)
+        return query
+
+    async def claim_window(self, db, start: datetime, end: datetime, session_id: str) -> bool:
+        """
+        Claim this user's window with one upsert (unique on user_id + window).
+        False if it was already claimed or processed, by this or another process.
+        """
+        if db is None:
+            return True
+        window_filter = self._window_filter(start, end)
+        claimed_at = now_ist()
+        try:
+            result = await db.alert_windows.update_one(
+                window_filter,
+                {"$setOnInsert": {
+                    **window_filter,
+                    "window_start_ist": start,
+                    "window_end_ist": end,
+                    "claimed_at_ist": claimed_at,
+                    "status": "claimed",
+                    "timezone": "IST",
+                    "langfuse_session_id": session_id,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # concurrent upsert won the race
+        return result.upserted_id is not None
 
-    def mark_processed(self, db, start: datetime, end: datetime, session_id: str, incident_id: Any):
-        """Mark window as processed for this user."""
+    async def release_window(self, db, start: datetime, end: datetime):
+        """Drop an unfinished claim so the window can be retried"""
         if db is None:
             return
+        try:
+            await db.alert_windows.delete_one(self._window_filter(start, end))
+        except Exception as e:
+            logger.warning(f"[Batch] Could not release window claim: {e}")
 
+    def mark_processed(self, start: datetime, end: datetime, session_id: str, incident_id: Any) -> UpdateOne:
+        """Build the alert_windows update marking this user's window processed (flushed per tick in bulk)"""
+        # The filter carries the formatted window strings and user_id, so $set reuses it
+        window_filter = self._window_filter(start, end)
+        processed_at = now_ist()
         doc = {
+            **window_filter,
             "window_start_ist": start,
             "window_end_ist": end,
-            "window_start_ist_str": format_ist(start, include_tz=True),
-            "window_end_ist_str": format_ist(end, include_tz=True),
 
-            "processed_at_ist": now_ist(),
-            "processed_at_ist_str": format_ist(now_ist(), include_tz=True),
+            "processed_at_ist": processed_at,
+            "processed_at_ist_str": format_ist(processed_at, include_tz=True),
+            "status": "done",
             "timezone": "IST",
 
             "langfuse_session_id": session_id,
             "incident_id": incident_id,
         }
-        
-        # Add user_id for multi-user
-        if self.user_id:
-            doc["user_id"] = self.user_id
-
-        db.alert_windows.update_one(
-            {
-                "window_start_ist_str": format_ist(start, include_tz=True),
-                "window_end_ist_str": format_ist(end, include_tz=True),
-                **({"user_id": self.user_id} if self.user_id else {})
-            },
-            {"$set": doc},
-            upsert=True
+
+        return UpdateOne(window_filter, {"$set": doc}, upsert=True)
+
+    @staticmethod
+    def metrics_key(metrics: List[Dict]) -> bytes:
+        """Content hash of a metrics snapshot (values rounded to 2 decimals)"""
+        rows = sorted(
+            (m["instance"], m["name"], f"{m['value']:.2f}" if isinstance(m["value"], float) else str(m["value"]))
+            for m in metrics
         )
+        return hashlib.blake2b(orjson.dumps(rows), digest_size=16).digest()
 
     def build_prompt(self, metrics: List[Dict], start: datetime, end: datetime) -> str:
         """Build LLM analysis prompt with IST times."""
-        grouped: Dict[str, List[Dict]] = {}
+        grouped: Dict[str, List[Dict]] = defaultdict(list)
         for m in metrics:
-            inst = m.get("instance", "unknown")
-            grouped.setdefault(inst, []).append(m)
+            grouped[m.get("instance", "unknown")].append(m)
 
+        # Instances in name order (a handful of keys) keep the prompt stable between
+        # windows; metrics stay in Prometheus order, capped per instance without sorting
         lines, total = [], 0
-        for inst, inst_metrics in sorted(grouped.items()):
+        for inst in sorted(grouped):
+            # One slice per instance covers both the per-instance and the global cap
+            chunk = grouped[inst][:min(BATCH_METRICS_PER_INSTANCE, self.max_metrics - total)]
             lines.append(f"\n### Instance: {inst}")
-            for m in sorted(inst_metrics, key=lambda x: x.get("name", ""))[:200]:
-                if total >= self.max_metrics:
-                    break
-                lines.append(f"  {m['name']}: {m['value']}")
-                total += 1
+            lines.extend([f"  {m['name']}: {m['value']}" for m in chunk])
+            total += len(chunk)
             if total >= self.max_metrics:
                 lines.append(f"\n  ... (capped at {self.max_metrics})")
                 break
 
-        schema = {
-            "incident": {
-                "title": "string", "severity": "low|medium|high|critical",
-                "confidence": 0.0, "summary": "string", "root_cause": "string",
-                "contributing_factors": [], "blast_radius": "string",
-                "evidence": [{"metric": "", "instance": "", "value": 0, "why_it_matters": ""}],
-                "fix_plan": {"immediate": [], "next_24h": [], "prevention": []}
-            },
-            "anomalies": [{"metric": "", "instance": "", "observed": 0, "expected": "", "symptom": "", "cluster": ""}],
-            "clusters": [{"name": "", "theme": "", "anomaly_indexes": []}]
-        }
-
-        start_str = format_ist(start, include_tz=True)
-        end_str = format_ist(end, include_tz=True)
+        window = self._window_filter(start, end)
+        start_str, end_str = window["window_start_ist_str"], window["window_end_ist_str"]
+        body = "\n".join(lines)
 
         return f"""You are an expert SRE analyzing Prometheus metrics.
 
@@ -160,18 +238,16 @@ TASKS:
 4. Return ONLY valid JSON (no markdown)
 
 METRICS ({total}/{len(metrics)} included):
-{"".join(lines)}
+{body}
 
 SCHEMA:
-{json.dumps(schema, indent=2)}
+{BATCH_SCHEMA_JSON}
 
 RETURN ONLY JSON:"""
 
     async def call_llm(self, prompt: str, session_id: str, metadata: Dict) -> Dict:
-        # ✅ LLM model/provider is read by ask_llm() from env
-        result = await asyncio.get_event_loop().run_in_executor(
-            None, ask_llm, prompt, "Batch Collective RCA", metadata, session_id
-        )
+        # ✅ LLM model/provider is read by ask_llm_async() from env
+        result = await ask_llm_async(prompt, "Batch Collective RCA", metadata, session_id, json_mode=True)
         if not result:
             return {}
         text, _ = result
@@ -180,47 +256,51 @@ RETURN ONLY JSON:"""
     def _pick_primary_instance(self, metrics: List[Dict], analysis: Dict) -> str:
         """Pick a real ip:port instance. Never use blast_radius."""
         inc = analysis.get("incident", {}) or {}
-        candidates: List[str] = []
-
-        for a in (analysis.get("anomalies", []) or []):
-            inst = a.get("instance")
-            if looks_like_instance(inst):
-                candidates.append(inst)
-
-        for e in (inc.get("evidence", []) or []):
-            inst = e.get("instance")
-            if looks_like_instance(inst):
-                candidates.append(inst)
-
-        for m in (metrics or []):
-            inst = m.get("instance")
-            if looks_like_instance(inst):
-                candidates.append(inst)
-
-        return candidates[0] if candidates else "unknown"
-
-    def store_results(self, db, start: datetime, end: datetime, session_id: str,
-                      metrics: List[Dict], analysis: Dict) -> Tuple[Any, Any]:
-        """Store results; DB will ALWAYS have correct instance/ip/port and user_id."""
+        # First match wins: anomalies, then evidence, then the raw metrics
+        candidates = chain(
+            (a.get("instance") for a in (analysis.get("anomalies", []) or [])),
+            (e.get("instance") for e in (inc.get("evidence", []) or [])),
+            (m.get("instance") for m in (metrics or [])),
+        )
+        return next((inst for inst in candidates if looks_like_instance(inst)), "unknown")
+
+    async def store_results(self, db, start: datetime, end: datetime, session_id: str,
+                            metrics: List[Dict], analysis: Dict) -> Tuple[Any, Any]:
+        """
+        Store results; DB will ALWAYS have correct instance/ip/port and user_id.
+        Ids are generated client-side so the four collections are written concurrently.
+        """
         if db is None:
             return None, None
 
         created_ist = now_ist()
 
         created_ist_str = format_ist(created_ist, include_tz=True)
-        start_ist_str = format_ist(start, include_tz=True)
-        end_ist_str = format_ist(end, include_tz=True)
+        window = self._window_filter(start, end)
+        start_ist_str, end_ist_str = window["window_start_ist_str"], window["window_end_ist_str"]
+
+        # Anomalies mostly repeat a few instances: parse each one once per batch
+        resolved: Dict[str, Tuple[str, Optional[int], Dict]] = {}
+
+        def resolve(inst: str) -> Tuple[str, Optional[int], Dict]:
+            if inst not in resolved:
+                resolved[inst] = (*parse_instance(inst), build_source(instance=inst))
+            return resolved[inst]
 
         primary_instance = self._pick_primary_instance(metrics, analysis)
-        ip, port = parse_instance(primary_instance)
-        source_obj = build_source(instance=primary_instance)
+        ip, port, source_obj = resolve(primary_instance)
 
-        batch_id = incident_id = None
+        # Add user_id for multi-user
+        owner = {"user_id": self.user_id} if self.user_id else {}
+
+        batch_id, incident_id = ObjectId(), ObjectId()
         try:
             batch_doc = {
+                "_id": batch_id,
                 "window_start_ist": start,
                 "window_end_ist": end,
                 "collected_at_ist": created_ist,
+                SORT_TS_FIELD: created_ist,
                 "timezone": "IST",
 
                 "window_start_ist_str": start_ist_str,
@@ -236,17 +316,15 @@ RETURN ONLY JSON:"""
                 "source": source_obj,
 
                 "langfuse_session_id": session_id,
+                **owner,
             }
-            # Add user_id for multi-user
-            if self.user_id:
-                batch_doc["user_id"] = self.user_id
-            
-            batch_id = db.metrics_batches.insert_one(batch_doc).inserted_id
 
             inc = analysis.get("incident", {}) or {}
 
             incident_doc = {
+                "_id": incident_id,
                 "created_at_ist": created_ist,
+                SORT_TS_FIELD: created_ist,
                 "timezone": "IST",
                 "created_at_ist_str": created_ist_str,
 
@@ -276,55 +354,51 @@ RETURN ONLY JSON:"""
                 "clusters": analysis.get("clusters", []),
                 "langfuse_session_id": session_id,
                 "raw_analysis": analysis,
+                **owner,
             }
-            # Add user_id for multi-user
-            if self.user_id:
-                incident_doc["user_id"] = self.user_id
-            
-            incident_id = db.incidents.insert_one(incident_doc).inserted_id
 
             anomalies = analysis.get("anomalies", []) or []
-            if anomalies:
-                docs = []
-                for a in anomalies:
-                    inst = a.get("instance", "unknown")
-                    if not looks_like_instance(inst):
-                        inst = primary_instance
-
-                    a_ip, a_port = parse_instance(inst)
-                    anomaly_doc = {
-                        "created_at_ist": created_ist,
-                        "timezone": "IST",
-                        "created_at_ist_str": created_ist_str,
-
-                        "window_start_ist": start,
-                        "window_end_ist": end,
-                        "window_start_ist_str": start_ist_str,
-                        "window_end_ist_str": end_ist_str,
-
-                        "batch_id": batch_id,
-                        "incident_id": incident_id,
-
-                        "metric": a.get("metric"),
-                        "instance": inst,
-                        "ip": a_ip,
-                        "port": a_port,
-                        "source": build_source(instance=inst),
-
-                        "observed": a.get("observed"),
-                        "expected": a.get("expected"),
-                        "symptom": a.get("symptom"),
-                        "cluster": a.get("cluster"),
-                        "langfuse_session_id": session_id,
-                    }
-                    # Add user_id for multi-user
-                    if self.user_id:
-                        anomaly_doc["user_id"] = self.user_id
-                    docs.append(anomaly_doc)
-                db.anomalies.insert_many(docs)
+            # Fields shared by every anomaly in the batch, merged into each doc in one step
+            fixed = {
+                "created_at_ist": created_ist,
+                SORT_TS_FIELD: created_ist,
+                "timezone": "IST",
+                "created_at_ist_str": created_ist_str,
+
+                "window_start_ist": start,
+                "window_end_ist": end,
+                "window_start_ist_str": start_ist_str,
+                "window_end_ist_str": end_ist_str,
+
+                "batch_id": batch_id,
+                "incident_id": incident_id,
+                "langfuse_session_id": session_id,
+                **owner,
+            }
+            docs = []
+            for a in anomalies:
+                inst = a.get("instance", "unknown")
+                if not looks_like_instance(inst):
+                    inst = primary_instance
+
+                a_ip, a_port, a_source = resolve(inst)
+                docs.append({
+                    **fixed,
+                    "metric": a.get("metric"),
+                    "instance": inst,
+                    "ip": a_ip,
+                    "port": a_port,
+                    "source": a_source,
+
+                    "observed": a.get("observed"),
+                    "expected": a.get("expected"),
+                    "symptom": a.get("symptom"),
+                    "cluster": a.get("cluster"),
+                })
 
             rca_doc = {
                 "timestamp_ist": created_ist,
+                SORT_TS_FIELD: created_ist,
                 "timezone": "IST",
                 "timestamp_ist_str": created_ist_str,
 
@@ -346,17 +420,23 @@ RETURN ONLY JSON:"""
                 "fix": inc.get("fix_plan", {}).get("immediate", []),
                 "langfuse_session_id": session_id,
                 "raw": analysis,
+                **owner,
             }
-            # Add user_id for multi-user
-            if self.user_id:
-                rca_doc["user_id"] = self.user_id
-            
-            db.rca.insert_one(rca_doc)
+
+            writes = [
+                db.metrics_batches.insert_one(batch_doc),
+                db.incidents.insert_one(incident_doc),
+                db.rca.insert_one(rca_doc),
+            ]
+            if docs:
+                writes.append(db.anomalies.insert_many(docs, ordered=False))
+            await asyncio.gather(*writes)
 
             logger.info(f"[Batch] Stored: batch={batch_id}, incident={incident_id}, anomalies={len(anomalies)}")
 
         except Exception as e:
             logger.error(f"[Batch] Storage error: {e}", exc_info=True)
+            return None, None
 
         return batch_id, incident_id
 
@@ -393,18 +473,22 @@ RETURN ONLY JSON:"""
         except Exception as e:
             logger.error(f"[Alerts] Email error: {e}")
 
-    async def run_worker(self):
-        start, end = self.get_window()
-        session_id = self.get_session_id(start)
+    async def run_worker(self, window: Optional[Tuple[datetime, datetime, str]] = None) -> Optional[UpdateOne]:
+        """
+        Analyze a window for this user (the tick's window, else the current one).
+        Returns the alert_windows update marking it processed, for the caller to write.
+        """
+        start, end, session_id = self.get_window(window)
         window_str = f"{start.strftime('%H:%M')}->{end.strftime('%H:%M')} IST"
 
         user_log = f" [User: {self.user_id}]" if self.user_id else ""
         logger.info(f"[Batch]{user_log} Running: {window_str} | Session: {session_id}")
 
-        db = get_db()
-        if self.is_processed(db, start, end):
+        db = await get_async_db()
+        if not await self.claim_window(db, start, end, session_id):
             logger.info(f"[Batch]{user_log} Already processed - skipping")
             return
+        processed = False
 
         langfuse = get_langfuse_client()
         span_ctx = prop_ctx = None
@@ -430,7 +514,6 @@ RETURN ONLY JSON:"""
         try:
             # Fetch metrics for this specific user only
             if self.user_id:
-                from app.services.prometheus_service import fetch_metrics_for_user
                 metrics = await fetch_metrics_for_user(self.user_id)
             else:
                 # Fallback to all metrics if no user_id (backward compatibility)
@@ -442,6 +525,13 @@ RETURN ONLY JSON:"""
 
             logger.info(f"[Batch]{user_log} Fetched {len(metrics)} metrics")
 
+            # Idle targets repeat the same snapshot: reuse the last low-severity result
+            metrics_key = self.metrics_key(metrics)
+            if metrics_key == self._last_key and self._last_low_incident_id is not None:
+                logger.info(f"[Batch]{user_log} Skipped unchanged metrics")
+                processed = True
+                return self.mark_processed(start, end, session_id, self._last_low_incident_id)
+
             # ===== ACTIVE: Gemma3 metadata =====
             llm_metadata = {
                 "window_start": start.isoformat(),
@@ -482,11 +572,17 @@ RETURN ONLY JSON:"""
                 f"[Batch]{user_log} Result: {incident.get('title')} | {incident.get('severity')} | {len(anomalies)} anomalies"
             )
 
-            _, incident_id = self.store_results(db, start, end, session_id, metrics, analysis)
-            self.send_alerts(incident, anomalies, start, end, session_id)
-            self.mark_processed(db, start, end, session_id, incident_id)
+            _, incident_id = await self.store_results(db, start, end, session_id, metrics, analysis)
+            self._last_key = metrics_key
+            self._last_low_incident_id = incident_id if incident.get("severity", "low") == "low" else None
+            await asyncio.get_running_loop().run_in_executor(
+                _ALERT_EXEC, self.send_alerts, incident, anomalies, start, end, session_id
+            )
+            processed = True
 
         finally:
+            if not processed:
+                await self.release_window(db, start, end)
             if prop_ctx:
                 try:
                     prop_ctx.__exit__(None, None, None)
@@ -499,77 +595,59 @@ RETURN ONLY JSON:"""
                     pass
 
         logger.info(f"[Batch]{user_log} Complete: {window_str}")
-
-    async def run_loop(self):
-        """Continuous batch monitoring loop with IST scheduling."""
-        logger.info(f"[Batch] Monitor started (every {self.interval} min)")
-
-        while True:
-            try:
-                now = now_ist()
-                bucket = (now.minute // self.interval) * self.interval
-                next_run = now.replace(minute=bucket, second=0, microsecond=0)
-                if now >= next_run:
-                    next_run += timedelta(minutes=self.interval)
-
-                sleep_sec = (next_run - now).total_seconds()
-                if sleep_sec > 0:
-                    logger.info(f"[Batch] Next run: {next_run.strftime('%H:%M:%S')} IST ({sleep_sec:.0f}s)")
-                    await asyncio.sleep(sleep_sec)
-
-                await self.run_worker()
-
-            except asyncio.CancelledError:
-                logger.info("[Batch] Monitor stopped")
-                break
-            except Exception as e:
-                logger.error(f"[Batch] Error: {e}", exc_info=True)
-                await asyncio.sleep(60)
-
-    def start(self) -> asyncio.Task:
-        self._task = asyncio.create_task(self.run_loop())
-        return self._task
-
-    async def stop(self):
-        if self._task:
-            self._task.cancel()
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
+        return self.mark_processed(start, end, session_id, incident_id)
 
 
 class UserBatchMonitorManager:
     """Manages batch monitors for multiple users"""
     
-    def __init__(self):
+    def __init__(self, interval_minutes: int = BATCH_INTERVAL_MINUTES):
+        self.interval = interval_minutes
         self.monitors: Dict[str, BatchMonitor] = {}
         self._refresh_task: Optional[asyncio.Task] = None
+        self._tick_task: Optional[asyncio.Task] = None
+        # In-flight ticks: a slow window never holds back the next one
+        self._ticks: set = set()
+        # Users with a window still in flight: a BatchMonitor must not run two windows at once
+        self._running: set = set()
+        self._sem = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    def _stagger_seconds(self, user_id: str) -> int:
+        """Stable per-user offset within the first half of the window, so users don't all start at once"""
+        return zlib.crc32(user_id.encode()) % max(1, self.interval * 30)
+
+    async def _run_monitor(self, monitor: BatchMonitor, window: Tuple[datetime, datetime, str]):
+        # The window is fixed by the tick, so the stagger and semaphore waits
+        # can't push this user into the next bucket
+        try:
+            if monitor.user_id:
+                await asyncio.sleep(self._stagger_seconds(monitor.user_id))
+            async with self._sem:
+                return await monitor.run_worker(window)
+        finally:
+            self._running.discard(monitor.user_id)
     
     async def refresh_monitors(self):
         """Refresh monitors based on users with active targets"""
-        db = get_db()
+        db = await get_async_db()
         if db is None:
             return
         
         try:
             # Get all unique user_ids with enabled targets
-            user_ids = db.targets.distinct("user_id", {"enabled": True})
+            user_ids = await db.targets.distinct("user_id", {"enabled": True})
             
             # Start monitors for new users
             for user_id in user_ids:
                 if user_id and user_id not in self.monitors:
                     logger.info(f"[MonitorManager] Starting monitor for user: {user_id}")
-                    monitor = BatchMonitor(user_id=user_id)
-                    monitor.start()
-                    self.monitors[user_id] = monitor
+                    self.monitors[user_id] = BatchMonitor(interval_minutes=self.interval, user_id=user_id)
             
             # Stop monitors for users without targets
             to_remove = []
             for user_id in self.monitors:
                 if user_id not in user_ids:
                     logger.info(f"[MonitorManager] Stopping monitor for user: {user_id}")
-                    await self.monitors[user_id].stop()
                     to_remove.append(user_id)
             
             for user_id in to_remove:
@@ -578,6 +656,87 @@ class UserBatchMonitorManager:
         except Exception as e:
             logger.error(f"[MonitorManager] Error refreshing monitors: {e}")
     
+    async def tick(self, window: Tuple[datetime, datetime, str]):
+        """
+        Run every user's batch `window` concurrently (at most BATCH_MAX_CONCURRENCY at once).
+        A user still busy with an earlier window skips this one, so the backlog can't grow
+        and one monitor never runs two windows at once.
+        """
+        monitors = []
+        for user_id, monitor in list(self.monitors.items()):
+            if user_id in self._running:
+                logger.warning(f"[Batch] [User: {user_id}] Previous window still running, skipping {window[2]}")
+            else:
+                monitors.append(monitor)
+        if not monitors:
+            return
+
+        # Each user is released by _run_monitor as soon as their own run ends
+        self._running.update(m.user_id for m in monitors)
+        results = await asyncio.gather(*(self._run_monitor(m, window) for m in monitors), return_exceptions=True)
+
+        processed = []
+        for monitor, result in zip(monitors, results):
+            if isinstance(result, Exception):
+                logger.error(f"[Batch] [User: {monitor.user_id}] Error: {result}", exc_info=result)
+            elif result is not None:
+                processed.append(result)
+
+        await self.flush_processed(processed)
+
+    async def flush_processed(self, ops: List[UpdateOne]):
+        """Mark this tick's finished windows processed in one unordered bulk write"""
+        if not ops:
+            return
+        db = await get_async_db()
+        if db is None:
+            return
+        try:
+            await db.alert_windows.bulk_write(ops, ordered=False)
+        except Exception as e:
+            # Claims stay in place: results are stored, so the windows must not be re-run
+            logger.error(f"[Batch] Could not mark {len(ops)} windows processed: {e}")
+
+    def _tick_done(self, task: asyncio.Task):
+        self._ticks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"[Batch] Tick failed: {task.exception()}", exc_info=task.exception())
+
+    async def run_loop(self):
+        """
+        Shared batch loop with IST scheduling: one tick per window for all users.
+        Each tick runs as its own task, so a slow user never delays or skips the next window.
+        """
+        logger.info(f"[Batch] Scheduler started (every {self.interval} min)")
+
+        while True:
+            try:
+                now = now_ist()
+                bucket = (now.minute // self.interval) * self.interval
+                next_run = now.replace(minute=bucket, second=0, microsecond=0)
+                if now >= next_run:
+                    next_run += timedelta(minutes=self.interval)
+
+                sleep_sec = (next_run - now).total_seconds()
+                if sleep_sec > 0:
+                    logger.info(f"[Batch] Next run: {next_run.strftime('%H:%M:%S')} IST ({sleep_sec:.0f}s)")
+                    await asyncio.sleep(sleep_sec)
+
+                # Computed once from the scheduled boundary and shared by every user
+                task = asyncio.create_task(self.tick(batch_window(next_run, self.interval)))
+                self._ticks.add(task)
+                task.add_done_callback(self._tick_done)
+
+                # Never wake twice for the same boundary if the sleep returned a little early
+                await asyncio.sleep(max(0.0, (next_run - now_ist()).total_seconds()) + 1)
+
+            except asyncio.CancelledError:
+                logger.info("[Batch] Scheduler stopped")
+                break
+            except Exception as e:
+                logger.error(f"[Batch] Error: {e}", exc_info=True)
+                await asyncio.sleep(60)
+
     async def refresh_loop(self):
         """Periodically refresh monitors (every 5 minutes)"""
         while True:
@@ -593,20 +752,18 @@ class UserBatchMonitorManager:
     def start(self):
         """Start the monitor manager"""
         self._refresh_task = asyncio.create_task(self.refresh_loop())
+        self._tick_task = asyncio.create_task(self.run_loop())
         logger.info("[MonitorManager] Started")
     
     async def stop(self):
         """Stop all monitors"""
-        if self._refresh_task:
-            self._refresh_task.cancel()
-            try:
-                await self._refresh_task
-            except asyncio.CancelledError:
-                pass
-        
-        for user_id, monitor in self.monitors.items():
-            logger.info(f"[MonitorManager] Stopping monitor for user: {user_id}")
-            await monitor.stop()
+        for task in (self._refresh_task, self._tick_task, *self._ticks):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         
         self.monitors.clear()
         logger.info("[MonitorManager] Stopped")
@@ -636,47 +793,19 @@ async def lifespan(app: FastAPI):
     logger.info(f"[Config] MongoDB: {MONGO_URI[:30] if MONGO_URI else 'NOT SET'}...")
     logger.info(f"[Config] Batch Interval: {BATCH_INTERVAL_MINUTES} min")
 
+    # Request-side to_thread work (SMTP/Slack config checks, targets file writes)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
     initialize_langfuse()
+    start_kdf_pool()
+    await init_redis()
     logger.info(f"[Langfuse] {'✅ Enabled' if is_langfuse_enabled() else '❌ Disabled'}")
     logger.info(f"[Slack] {'✅ Enabled' if slack_is_configured() else '❌ Disabled'}") 
 
     db = get_db()
     if db is not None:
-        try:
-            # Create users collection indexes
-            db.users.create_index("username", unique=True)
-            db.users.create_index("email", unique=True)
-            
-            # Create sessions collection indexes
-            db.sessions.create_index("session_id", unique=True)
-            db.sessions.create_index([("user_id", 1), ("active", 1)])
-            db.sessions.create_index("last_active")
-            
-            # indexes
-            db.chat_sessions.create_index("session_id", unique=True)
-            db.chat_sessions.create_index("last_activity")
-
-            db.metrics_batches.create_index([("window_start_ist_str", -1), ("window_end_ist_str", -1)])
-            db.metrics_batches.create_index([("user_id", 1), ("window_start_ist_str", -1)])
-            
-            db.incidents.create_index([("window_start_ist_str", -1), ("severity", 1)])
-            db.incidents.create_index([("ip", 1), ("window_start_ist_str", -1)])
-            db.incidents.create_index([("user_id", 1), ("severity", 1)])
-            
-            db.anomalies.create_index([("window_start_ist_str", -1), ("instance", 1)])
-            db.anomalies.create_index([("ip", 1), ("window_start_ist_str", -1)])
-            db.anomalies.create_index([("user_id", 1), ("created_at_ist", -1)])
-            
-            db.rca.create_index([("user_id", 1), ("timestamp_ist", -1)])
-            
-            db.targets.create_index([("user_id", 1), ("endpoint", 1)])
-            
-            db.alert_windows.create_index([("window_start_ist_str", 1), ("window_end_ist_str", 1)], unique=True)
-            db.alert_windows.create_index([("user_id", 1), ("window_start_ist_str", 1)])
-
-            logger.info("[Database] Indexes created")
-        except Exception as e:
-            logger.warning(f"[Database] Index warning: {e}")
+        ensure_indexes(db)
+    # Open the async pool now so the first request does not pay connect + ping
+    await get_async_db()
 
     # Start multi-user monitor manager
     monitor_manager.start()
@@ -684,12 +813,15 @@ async def lifespan(app: FastAPI):
 
     async def cleanup_sessions():
         while True:
-            await asyncio.sleep(3600)
-            cleanup_db = get_db()
+            # Jittered so several instances don't all hit Mongo in the same minute
+            await asyncio.sleep(3600 + random.uniform(0, 300))
+            cleanup_db = await get_async_db()
             if cleanup_db is not None:
-                session_manager.cleanup_old_sessions(cleanup_db, hours=720)
+                await session_manager.cleanup_old_sessions(cleanup_db, hours=720)
 
     cleanup_task = asyncio.create_task(cleanup_sessions())
+    start_targets_writer()
+    start_session_activity_flusher()
 
     logger.info("[Startup] ✅ Ready")
     logger.info("=" * 60)
@@ -698,11 +830,19 @@ async def lifespan(app: FastAPI):
 
     logger.info("[Shutdown] Stopping services...")
     await monitor_manager.stop()
+    shutdown_kdf_pool()
+    _ALERT_EXEC.shutdown(wait=False)
+    await close_prometheus_client()
+    await close_llm_clients()
+    await close_redis()
+    await stop_targets_writer()
+    await stop_session_activity_flusher()
     cleanup_task.cancel()
     try:
         await cleanup_task
     except asyncio.CancelledError:
         pass
+    await close_mongo()
     logger.info("[Shutdown] ✅ Complete")
 
 
@@ -711,6 +851,7 @@ app = FastAPI(
     description="Intelligent monitoring with LLM-based anomaly detection and AI-powered RCA (IST Timezone)",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc",
 )
@@ -725,6 +866,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 Instrumentator().instrument(app).expose(app)
@@ -732,4 +874,5 @@ Instrumentator().instrument(app).expose(app)
 app.include_router(api_router)
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # loop/http "auto" pick uvloop and httptools when installed (uvloop is not available on Windows)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True, loop="auto", http="auto")
\ No newline at end of file
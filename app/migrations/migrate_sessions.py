@@ -9,7 +9,7 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from app.services.mongodb_service import get_db
+from app.services.mongodb_service import SESSION_TTL_SECONDS, get_db
 from app.core.logging import logger
 
 
@@ -28,13 +28,12 @@ def migrate_sessions():
         
         # Create indexes
         db.sessions.create_index("session_id", unique=True)
-        db.sessions.create_index([("user_id", 1), ("active", 1)])
-        db.sessions.create_index("last_active")
+        db.sessions.create_index([("user_id", 1), ("active", 1), ("last_active", -1)])
         
         logger.info("[Migration] Created sessions indexes")
         
         # Create TTL index to auto-delete old sessions after 30 days
-        db.sessions.create_index("last_active", expireAfterSeconds=2592000)  # 30 days
+        db.sessions.create_index("last_active", expireAfterSeconds=SESSION_TTL_SECONDS)
         logger.info("[Migration] Created TTL index for session cleanup")
         
         return True
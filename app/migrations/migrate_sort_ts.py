@@ -0,0 +1,62 @@
+"""
+Database Migration: Backfill canonical sort key
+Run this script once to stamp _sort_ts on documents written before it existed.
+List endpoints sort only on _sort_ts; documents without it are listed last.
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from app.services.mongodb_service import get_db, ensure_indexes, SORT_TS_FIELD
+from app.core.logging import logger
+
+
+# collection -> timestamp fields in precedence order (same chains the API used to sort on)
+SORT_SOURCES = {
+    "metrics_batches": ["collected_at_ist", "collected_at", "timestamp"],
+    "incidents": ["created_at_ist", "created_at", "timestamp"],
+    "anomalies": ["created_at_ist", "created_at", "timestamp"],
+    "rca": ["timestamp_ist", "timestamp", "created_at_ist", "created_at"],
+}
+
+
+def migrate_sort_ts():
+    """Set _sort_ts = first present timestamp field, falling back to the _id creation time"""
+    db = get_db()
+    if db is None:
+        logger.error("[Migration] Database unavailable")
+        return False
+
+    try:
+        for name, fields in SORT_SOURCES.items():
+            sort_ts = {"$ifNull": [f"${f}" for f in fields] + [{"$toDate": "$_id"}]}
+            result = db[name].update_many(
+                {SORT_TS_FIELD: {"$exists": False}},
+                [{"$set": {SORT_TS_FIELD: sort_ts}}],
+            )
+            logger.info(f"[Migration] {name}: backfilled {result.modified_count} documents")
+
+        ensure_indexes(db)
+        logger.info("[Migration] Ensured sort indexes")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"[Migration] Error: {e}", exc_info=True)
+        return False
+
+
+def main():
+    logger.info("[Migration] Starting sort key backfill...")
+
+    if migrate_sort_ts():
+        logger.info("[Migration] ✅ Migration completed successfully")
+    else:
+        logger.error("[Migration] ❌ Migration failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
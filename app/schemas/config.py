@@ -1,6 +1,12 @@
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 class EmailConfig(BaseModel):
     enabled: bool
     recipients: List[str]
+
+    @field_validator('recipients')
+    @classmethod
+    def normalize_recipients(cls, v: List[str]) -> List[str]:
+        """Trim, lowercase and de-duplicate once at save time (order kept)"""
+        return list(dict.fromkeys(e.strip().lower() for e in v if e.strip()))
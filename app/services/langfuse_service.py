@@ -174,8 +174,8 @@ def langfuse_session(session_id: Optional[str]) -> Iterator[None]:
     Usage:
         session_id = "batch:202601290316-202601290317"
         with langfuse_session(session_id):
-            ask_llm("prompt 1")  # Uses session_id
-            ask_llm("prompt 2")  # Uses same session_id
+            await ask_llm_async("prompt 1")  # Uses session_id
+            await ask_llm_async("prompt 2")  # Uses same session_id
             
         # In Langfuse dashboard, both calls appear under one session
     """
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import os
-import requests
-from typing import Optional, Tuple
+from typing import AsyncIterator, Optional, Tuple
 from datetime import datetime
 
-from openai import OpenAI
+import httpx
+import orjson
+from openai import AsyncOpenAI
 
 from app.services.langfuse_service import (
     get_langfuse_client,
@@ -16,12 +17,47 @@ from app.core.logging import logger
 
 TIMEOUT_S = 120
 
+# Shared async clients: calls run on the event loop and reuse one bounded connection pool
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+_async_openai: Optional[AsyncOpenAI] = None
+_ollama_client: Optional[httpx.AsyncClient] = None
 
-def ask_llm(
+
+def _get_async_openai(api_key: str) -> AsyncOpenAI:
+    global _async_openai
+    if _async_openai is None:
+        _async_openai = AsyncOpenAI(
+            api_key=api_key,
+            timeout=TIMEOUT_S,
+            http_client=httpx.AsyncClient(timeout=TIMEOUT_S, limits=_HTTP_LIMITS),
+        )
+    return _async_openai
+
+
+def _get_ollama_client() -> httpx.AsyncClient:
+    global _ollama_client
+    if _ollama_client is None:
+        _ollama_client = httpx.AsyncClient(timeout=TIMEOUT_S, limits=_HTTP_LIMITS)
+    return _ollama_client
+
+
+async def close_llm_clients():
+    """Close the shared LLM HTTP clients (called at shutdown)"""
+    global _async_openai, _ollama_client
+    if _async_openai is not None:
+        await _async_openai.close()
+        _async_openai = None
+    if _ollama_client is not None:
+        await _ollama_client.aclose()
+        _ollama_client = None
+
+
+async def ask_llm_async(
     prompt: str,
     trace_name: str = "LLM Call",
     metadata: dict | None = None,
     session_id: Optional[str] = None,
+    json_mode: bool = False,
 ) -> Optional[Tuple[str, int]]:
     """
     LLM call with optional Langfuse tracing.
@@ -37,28 +73,114 @@ def ask_llm(
         - LLM_URL: Ollama/LM Studio endpoint
         - LLM_MODEL: Model name (default: gemma3:1b)
     
+    json_mode asks both providers for a bare JSON object (no markdown fences);
+    the prompt must mention JSON.
+    
     Returns: (response_text, total_tokens)
     """
 
     # Try OpenAI first
     try:
-        return _call_openai(prompt, trace_name, metadata, session_id)
+        return await _call_openai(prompt, trace_name, metadata, session_id, json_mode)
     except Exception as e:
         logger.warning(f"[LLM] OpenAI failed: {e}. Falling back to Gemma3...")
         
         # Fallback to Gemma3
         try:
-            return _call_gemma3(prompt, trace_name, metadata, session_id)
+            return await _call_gemma3(prompt, trace_name, metadata, session_id, json_mode)
         except Exception as fallback_error:
             logger.error(f"[LLM] Gemma3 fallback also failed: {fallback_error}")
             return None, 0
 
 
-def _call_openai(
+async def ask_llm_stream(prompt: str, usage: dict | None = None) -> AsyncIterator[str]:
+    """
+    Stream an LLM answer as text chunks using async clients (no executor thread held).
+    Primary: OpenAI; falls back to Gemma3 only if OpenAI fails before the first chunk.
+    Total tokens are written to usage["total_tokens"] once the stream finishes.
+    Not traced in Langfuse (spans cannot wrap a response that outlives the handler).
+    """
+    if usage is None:
+        usage = {}
+    usage["total_tokens"] = 0
+
+    started = False
+    try:
+        async for chunk in _stream_openai(prompt, usage):
+            started = True
+            yield chunk
+        return
+    except Exception as e:
+        if started:
+            logger.error(f"[LLM] OpenAI stream interrupted: {e}")
+            raise
+        logger.warning(f"[LLM] OpenAI stream failed: {e}. Falling back to Gemma3...")
+
+    async for chunk in _stream_gemma3(prompt, usage):
+        yield chunk
+
+
+async def _stream_openai(prompt: str, usage: dict) -> AsyncIterator[str]:
+    """Stream from OpenAI chat completions; usage arrives on the final chunk"""
+    from app.core import config
+
+    if not config.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not set in environment")
+
+    logger.info(f"[LLM] Streaming OpenAI model={config.OPENAI_MODEL} | prompt_chars={len(prompt or '')}")
+
+    stream = await _get_async_openai(config.OPENAI_API_KEY).chat.completions.create(
+        model=config.OPENAI_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    async for event in stream:
+        if event.usage:
+            usage["total_tokens"] = event.usage.total_tokens
+        if event.choices and event.choices[0].delta.content:
+            yield event.choices[0].delta.content
+
+
+async def _stream_gemma3(prompt: str, usage: dict) -> AsyncIterator[str]:
+    """Stream from Ollama/LM Studio /api/generate (newline-delimited JSON chunks)"""
+    from app.core import config
+
+    if not config.LLM_URL:
+        raise ValueError("LLM_URL not set in environment")
+
+    logger.info(f"[LLM] Streaming Gemma3 (FALLBACK) model={config.LLM_MODEL} | url={config.LLM_URL}")
+
+    payload = {
+        "model": config.LLM_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "options": {"temperature": 0.2},
+    }
+    parts = []
+    async with _get_ollama_client().stream("POST", f"{config.LLM_URL}/api/generate", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            data = orjson.loads(line)
+            text = data.get("response", "")
+            if text:
+                parts.append(text)
+                yield text
+            if data.get("done"):
+                in_tok = int(data.get("prompt_eval_count", 0) or 0)
+                out_tok = int(data.get("eval_count", 0) or 0)
+                usage["total_tokens"] = (in_tok + out_tok) or _estimate_tokens(prompt, "".join(parts))
+
+
+async def _call_openai(
     prompt: str,
     trace_name: str = "LLM Call",
     metadata: dict | None = None,
     session_id: Optional[str] = None,
+    json_mode: bool = False,
 ) -> Optional[Tuple[str, int]]:
     """
     Call OpenAI API (Primary LLM)
@@ -76,22 +198,23 @@ def _call_openai(
         f"prompt_chars={len(prompt or '')} words={len((prompt or '').split())}"
     )
     
-    client = OpenAI(api_key=api_key)
+    client = _get_async_openai(api_key)
     
-    def _call_openai_api() -> tuple[str, int, int, float]:
+    async def _call_openai_api() -> tuple[str, int, int, float]:
         """
         OpenAI API call.
         Returns: (text, input_tokens, output_tokens, latency_ms)
         """
         start_time = datetime.utcnow()
         
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "user", "content": prompt}
             ],
             temperature=0.2,
-            timeout=TIMEOUT_S
+            timeout=TIMEOUT_S,
+            **({"response_format": {"type": "json_object"}} if json_mode else {}),
         )
         
         latency_ms = (datetime.utcnow() - start_time).total_seconds() * 1000
@@ -133,7 +256,7 @@ def _call_openai(
                                 + (f" (session: {session_id})" if session_id else "")
                             )
                             
-                            text, in_tok, out_tok, latency_ms = _call_openai_api()
+                            text, in_tok, out_tok, latency_ms = await _call_openai_api()
                             
                             logger.info(f"[LLM] OpenAI response received ({latency_ms:.0f}ms)")
                             
@@ -165,7 +288,7 @@ def _call_openai(
     try:
         logger.info(f"[LLM] Calling OpenAI (no tracing)...")
         
-        text, in_tok, out_tok, latency_ms = _call_openai_api()
+        text, in_tok, out_tok, latency_ms = await _call_openai_api()
         
         logger.info(f"[LLM] OpenAI response received ({latency_ms:.0f}ms)")
         
@@ -177,11 +300,12 @@ def _call_openai(
         raise
 
 
-def _call_gemma3(
+async def _call_gemma3(
     prompt: str,
     trace_name: str = "LLM Call",
     metadata: dict | None = None,
     session_id: Optional[str] = None,
+    json_mode: bool = False,
 ) -> Optional[Tuple[str, int]]:
     """
     Call Gemma3 via Ollama/LM Studio (Fallback LLM)
@@ -199,7 +323,7 @@ def _call_gemma3(
         f"prompt_chars={len(prompt or '')} words={len((prompt or '').split())}"
     )
     
-    def _call_gemma3_api() -> tuple[str, int, int, float]:
+    async def _call_gemma3_api() -> tuple[str, int, int, float]:
         """
         Gemma3/Ollama API call.
         Returns: (text, input_tokens, output_tokens, latency_ms)
@@ -212,13 +336,13 @@ def _call_gemma3(
             "stream": False,
             "options": {
                 "temperature": 0.2,
-            }
+            },
+            **({"format": "json"} if json_mode else {}),
         }
         
-        response = requests.post(
+        response = await _get_ollama_client().post(
             f"{llm_url}/api/generate",
             json=payload,
-            timeout=TIMEOUT_S
         )
         response.raise_for_status()
         
@@ -262,7 +386,7 @@ def _call_gemma3(
                                 + (f" (session: {session_id})" if session_id else "")
                             )
                             
-                            text, in_tok, out_tok, latency_ms = _call_gemma3_api()
+                            text, in_tok, out_tok, latency_ms = await _call_gemma3_api()
                             
                             logger.info(f"[LLM] Gemma3 response received ({latency_ms:.0f}ms)")
                             
@@ -298,7 +422,7 @@ def _call_gemma3(
     try:
         logger.info(f"[LLM] Calling Gemma3 (FALLBACK, no tracing)...")
         
-        text, in_tok, out_tok, latency_ms = _call_gemma3_api()
+        text, in_tok, out_tok, latency_ms = await _call_gemma3_api()
         
         logger.info(f"[LLM] Gemma3 response received ({latency_ms:.0f}ms)")
         
@@ -1,6 +1,8 @@
 """
 db.py (MongoDB Service + Helpers)
 - Optimized MongoDB connection reuse + ping health check
+- Async client (PyMongo AsyncMongoClient) for async endpoints
+- Index definitions for every collection (created once at startup)
 - Helpers to standardize instance/ip/port parsing and source object
 - Validator to ensure only real Prometheus instance labels are treated as instance
 """
@@ -8,17 +10,49 @@ db.py (MongoDB Service + Helpers)
 from __future__ import annotations
 
 import re
+from functools import lru_cache
 from typing import Any, Dict, Optional, Tuple
 
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
 
-from app.core.config import MONGO_URI, DB_NAME
+from app.core.config import (
+    MONGO_URI,
+    DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_COMPRESSORS,
+)
 from app.core.logging import logger
 
+# Canonical newest-first sort key stamped on batches, incidents, anomalies and rca.
+# Legacy documents are backfilled by app/migrations/migrate_sort_ts.py.
+SORT_TS_FIELD = "_sort_ts"
+
+# Login sessions idle this long are purged by the last_active TTL index
+SESSION_TTL_SECONDS = 30 * 86400
+
+# Shared by the sync and async clients; each client is created once and reused
+_CLIENT_OPTIONS: Dict[str, Any] = dict(
+    serverSelectionTimeoutMS=2000,
+    connectTimeoutMS=2000,
+    socketTimeoutMS=5000,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    retryWrites=True,
+)
+if MONGO_COMPRESSORS:
+    # Negotiated with the server; unavailable compressors are skipped with a warning
+    _CLIENT_OPTIONS["compressors"] = MONGO_COMPRESSORS
+
 _mongo_client: Optional[MongoClient] = None
 _db_connected: bool = False
 
+_async_client: Optional[AsyncMongoClient] = None
+_async_db_connected: bool = False
+
 
 def get_db():
     """Get MongoDB database connection (cached)."""
@@ -32,15 +66,7 @@ def get_db():
     try:
         if _mongo_client is None:
             logger.info("[MongoDB] Connecting...")
-            _mongo_client = MongoClient(
-                uri,
-                serverSelectionTimeoutMS=2000,
-                connectTimeoutMS=2000,
-                socketTimeoutMS=5000,
-                maxPoolSize=10,
-                minPoolSize=1,
-                retryWrites=True,
-            )
+            _mongo_client = MongoClient(uri, **_CLIENT_OPTIONS)
             _db_connected = False
 
         if not _db_connected:
@@ -60,6 +86,204 @@ def get_db():
     return None
 
 
+async def get_async_db():
+    """Get async MongoDB database connection (cached). Use from async code paths."""
+    global _async_client, _async_db_connected
+
+    uri = (MONGO_URI or "").strip()
+    if not uri:
+        logger.error("[MongoDB Error] MONGO_URI not set")
+        return None
+
+    try:
+        if _async_client is None:
+            logger.info("[MongoDB] Connecting (async)...")
+            _async_client = AsyncMongoClient(uri, **_CLIENT_OPTIONS)
+            _async_db_connected = False
+
+        if not _async_db_connected:
+            await _async_client.admin.command("ping")
+            _async_db_connected = True
+            logger.info("[MongoDB] Connected (async)!")
+
+        return _async_client[DB_NAME]
+
+    except PyMongoError as e:
+        logger.error(f"[MongoDB Error] {e}")
+    except Exception as e:
+        logger.error(f"[MongoDB Error] Unexpected: {e}")
+
+    _async_client = None
+    _async_db_connected = False
+    return None
+
+
+async def close_mongo() -> None:
+    """Close both cached clients and their pools (called at shutdown)."""
+    global _mongo_client, _db_connected, _async_client, _async_db_connected
+
+    if _async_client is not None:
+        try:
+            await _async_client.close()
+        except Exception as e:
+            logger.warning(f"[MongoDB] Async close error: {e}")
+    if _mongo_client is not None:
+        try:
+            _mongo_client.close()
+        except Exception as e:
+            logger.warning(f"[MongoDB] Close error: {e}")
+
+    _mongo_client = None
+    _db_connected = False
+    _async_client = None
+    _async_db_connected = False
+
+
+def _ensure_targets_unique_index(db) -> None:
+    """
+    One target per (user_id, endpoint): backstop for the upsert in add_target.
+    Replaces the earlier non-unique index on the same keys; if duplicates already
+    exist the unique build fails and is logged, leaving the old index in place.
+    """
+    keys = [("user_id", 1), ("endpoint", 1)]
+    try:
+        db.targets.create_index(keys, unique=True)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+            logger.warning(f"[Database] targets unique index not created: {e}")
+            return
+        db.targets.drop_index(keys)
+        try:
+            db.targets.create_index(keys, unique=True)
+        except OperationFailure as e:
+            logger.warning(f"[Database] targets unique index not created: {e}")
+            db.targets.create_index(keys)
+
+
+def _ensure_zstd_collection(db, name: str) -> None:
+    """
+    Create a collection with zstd block compression (WiredTiger defaults to snappy).
+    Only applies on first creation; an existing collection keeps its compressor.
+    """
+    if db.list_collection_names(filter={"name": name}):
+        return
+    try:
+        db.create_collection(
+            name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+        )
+    except CollectionInvalid:
+        pass  # created concurrently
+
+
+def _ensure_alert_windows_unique_index(db) -> None:
+    """
+    One alert_windows row per (user_id, window): BatchMonitor claims a window with a
+    single upsert against it. Drops the earlier per-window unique index (which let only
+    one user process a given window) and the index this one's prefix now covers.
+    Runs apart from the other index builds: while the per-window index is left in
+    place, every user after the first has their claim rejected as already processed.
+    """
+    try:
+        db.alert_windows.drop_index("window_start_ist_str_1_window_end_ist_str_1")
+    except OperationFailure as e:
+        if e.code != 27:  # IndexNotFound: already gone
+            logger.error(f"[Database] legacy alert_windows unique index not dropped: {e}")
+    try:
+        db.alert_windows.create_index(
+            [("user_id", 1), ("window_start_ist_str", 1), ("window_end_ist_str", 1)], unique=True
+        )
+    except Exception as e:
+        logger.error(f"[Database] alert_windows unique index not created: {e}")
+        return
+    try:
+        db.alert_windows.drop_index("user_id_1_window_start_ist_str_1")
+    except OperationFailure:
+        pass  # already gone
+
+
+def _ensure_sessions_ttl_index(db) -> None:
+    """
+    TTL on sessions.last_active so Mongo purges idle sessions itself.
+    Replaces the earlier plain index on the same key (same name, different options).
+    """
+    try:
+        db.sessions.create_index("last_active", expireAfterSeconds=SESSION_TTL_SECONDS)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+            logger.warning(f"[Database] sessions TTL index not created: {e}")
+            return
+        db.sessions.drop_index("last_active_1")
+        db.sessions.create_index("last_active", expireAfterSeconds=SESSION_TTL_SECONDS)
+
+
+def ensure_indexes(db) -> None:
+    """Create all collection indexes (idempotent, called at startup)."""
+    # First and on its own: window claims depend on it (see the helper)
+    _ensure_alert_windows_unique_index(db)
+
+    try:
+        # metrics_batches embeds every fetched metric per window: compress it on disk
+        _ensure_zstd_collection(db, "metrics_batches")
+
+        # users: unique keys back login lookups and duplicate detection in register
+        db.users.create_index([("username", 1)], unique=True)
+        db.users.create_index([("email", 1)], unique=True)
+
+        # sessions
+        db.sessions.create_index("session_id", unique=True)
+        # get_user_sessions / revoke_all_sessions: filter and sort from one index
+        db.sessions.create_index([("user_id", 1), ("active", 1), ("last_active", -1)])
+        _ensure_sessions_ttl_index(db)
+        db.sessions.create_index([("user_id", 1), ("ip_address", 1), ("user_agent", 1)])
+
+        # chat sessions
+        db.chat_sessions.create_index("session_id", unique=True)
+        db.chat_sessions.create_index("last_activity")
+        # /stats active-session count (COUNT_SCAN on the prefix also serves the total)
+        db.chat_sessions.create_index([("user_id", 1), ("last_activity", -1)])
+
+        # descending sort keys so list endpoints scan-and-limit instead of sorting in memory
+        db.metrics_batches.create_index([("collected_at_ist", -1)])
+        db.incidents.create_index([("created_at_ist", -1)])
+        db.anomalies.create_index([("created_at_ist", -1)])
+        db.rca.create_index([("timestamp_ist", -1)])
+        db.metrics.create_index([("timestamp", -1), ("_id", -1)])
+        db.metrics.create_index("user_id")
+        db.chat_sessions.create_index([("last_activity", -1), ("_id", -1)])
+
+        # (filter, sort, _id) for the /by-ip variants: index-backed top-K, no in-memory SORT stage
+        db.metrics_batches.create_index([("ip", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.incidents.create_index([("ip", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.anomalies.create_index([("ip", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.rca.create_index([("ip", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.metrics.create_index([("ip", 1), ("timestamp", -1), ("_id", -1)])
+
+        db.metrics_batches.create_index([("window_start_ist_str", -1), ("window_end_ist_str", -1)])
+        db.metrics_batches.create_index([("user_id", 1), ("window_start_ist_str", -1)])
+        db.metrics_batches.create_index([("user_id", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+
+        db.incidents.create_index([("window_start_ist_str", -1), ("severity", 1)])
+        db.incidents.create_index([("ip", 1), ("window_start_ist_str", -1)])
+        db.incidents.create_index([("user_id", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.incidents.create_index([("user_id", 1), ("severity", 1)])
+
+        db.anomalies.create_index([("window_start_ist_str", -1), ("instance", 1)])
+        db.anomalies.create_index([("ip", 1), ("window_start_ist_str", -1)])
+        db.anomalies.create_index([("user_id", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+        db.anomalies.create_index([("user_id", 1), ("severity", 1)])
+
+        db.rca.create_index([("user_id", 1), (SORT_TS_FIELD, -1), ("_id", -1)])
+
+        _ensure_targets_unique_index(db)
+
+        db.email_config.create_index("user_id")
+
+        logger.info("[Database] Indexes created")
+    except Exception as e:
+        logger.warning(f"[Database] Index warning: {e}")
+
+
+@lru_cache(maxsize=1024)
 def parse_instance(instance: str) -> Tuple[str, Optional[int]]:
     """
     Parse:
@@ -128,8 +352,14 @@ _INSTANCE_RE = re.compile(
 )
 
 
+@lru_cache(maxsize=4096)
+def _matches_instance(value: str) -> bool:
+    return bool(_INSTANCE_RE.match(value.strip()))
+
+
 def looks_like_instance(value: Optional[str]) -> bool:
     """Return True if value looks like a Prometheus instance label."""
-    if not value:
+    # LLM output may put anything here; only strings are cached and matched
+    if not value or not isinstance(value, str):
         return False
-    return bool(_INSTANCE_RE.match(value.strip()))
+    return _matches_instance(value)
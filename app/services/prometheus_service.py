@@ -7,6 +7,27 @@ import httpx
 from app.core.config import PROM_URL
 from app.core.logging import logger
 
+# Shared pooled client: keeps connections to Prometheus alive across ticks and users
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=30.0),
+        )
+    return _client
+
+
+async def close_prometheus_client():
+    """Close the shared Prometheus client (called at shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
 async def get_active_targets() -> List[str]:
     """
@@ -14,32 +35,31 @@ async def get_active_targets() -> List[str]:
     This automatically discovers whatever you configured in prometheus.yml
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Query Prometheus targets API
-            resp = await client.get(f"{PROM_URL}/api/v1/targets")
-            resp.raise_for_status()
-            data = resp.json()
-            
-            if data.get("status") != "success":
-                logger.warning(f"[Prometheus] Targets API failed: {data.get('error', 'unknown')}")
-                return []
-            
-            # Extract unique job names from active targets
-            targets = data.get("data", {}).get("activeTargets", [])
-            jobs = set()
-            
-            for target in targets:
-                # Only include targets that are UP
-                if target.get("health") == "up":
-                    job = target.get("labels", {}).get("job")
-                    if job:
-                        jobs.add(job)
-                        logger.debug(f"[Prometheus] Found active job: {job}")
-            
-            job_list = list(jobs)
-            logger.info(f"[Prometheus] Discovered {len(job_list)} active jobs: {job_list}")
-            return job_list
-            
+        # Query Prometheus targets API
+        resp = await _get_client().get(f"{PROM_URL}/api/v1/targets", timeout=10.0)
+        resp.raise_for_status()
+        data = resp.json()
+        
+        if data.get("status") != "success":
+            logger.warning(f"[Prometheus] Targets API failed: {data.get('error', 'unknown')}")
+            return []
+        
+        # Extract unique job names from active targets
+        targets = data.get("data", {}).get("activeTargets", [])
+        jobs = set()
+        
+        for target in targets:
+            # Only include targets that are UP
+            if target.get("health") == "up":
+                job = target.get("labels", {}).get("job")
+                if job:
+                    jobs.add(job)
+                    logger.debug(f"[Prometheus] Found active job: {job}")
+        
+        job_list = list(jobs)
+        logger.info(f"[Prometheus] Discovered {len(job_list)} active jobs: {job_list}")
+        return job_list
+        
     except Exception as e:
         logger.error(f"[Prometheus] Error fetching targets: {e}")
         return []
@@ -48,55 +68,54 @@ async def get_active_targets() -> List[str]:
 async def fetch_metrics_from_prom(query: str) -> List[Dict]:
     """Execute a PromQL query against Prometheus"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(
-                f"{PROM_URL}/api/v1/query",
-                params={"query": query},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-
-            if data.get("status") != "success":
-                logger.warning(f"[Prometheus] Query failed: {data.get('error', 'unknown')}")
-                return []
-
-            results = data.get("data", {}).get("result", [])
+        resp = await _get_client().get(
+            f"{PROM_URL}/api/v1/query",
+            params={"query": query},
+        )
+        resp.raise_for_status()
+        data = resp.json()
+
+        if data.get("status") != "success":
+            logger.warning(f"[Prometheus] Query failed: {data.get('error', 'unknown')}")
+            return []
+
+        results = data.get("data", {}).get("result", [])
+        
+        metrics = []
+        for m in results:
+            name = m.get("metric", {}).get("__name__", "")
             
-            metrics = []
-            for m in results:
-                name = m.get("metric", {}).get("__name__", "")
-                
-                # Skip Prometheus internal metrics
-                if name.startswith(("prometheus_", "go_", "scrape_", "promhttp_")):
-                    continue
-                
-                # Extract value
-                val = m.get("value", [None, None])[1]
-                
-                # Extract instance
-                instance = m.get("metric", {}).get("instance", "unknown")
-                
-                # Extract user_id (important for multi-user)
-                user_id = m.get("metric", {}).get("user_id", "unknown")
-                
-                if val is not None and val != "":
-                    try:
-                        metrics.append({
-                            "name": name,
-                            "value": float(val),
-                            "instance": instance,
-                            "user_id": user_id
-                        })
-                    except Exception:
-                        metrics.append({
-                            "name": name,
-                            "value": val,
-                            "instance": instance,
-                            "user_id": user_id
-                        })
+            # Skip Prometheus internal metrics
+            if name.startswith(("prometheus_", "go_", "scrape_", "promhttp_")):
+                continue
             
-            return metrics
+            # Extract value
+            val = m.get("value", [None, None])[1]
             
+            # Extract instance
+            instance = m.get("metric", {}).get("instance", "unknown")
+            
+            # Extract user_id (important for multi-user)
+            user_id = m.get("metric", {}).get("user_id", "unknown")
+            
+            if val is not None and val != "":
+                try:
+                    metrics.append({
+                        "name": name,
+                        "value": float(val),
+                        "instance": instance,
+                        "user_id": user_id
+                    })
+                except Exception:
+                    metrics.append({
+                        "name": name,
+                        "value": val,
+                        "instance": instance,
+                        "user_id": user_id
+                    })
+        
+        return metrics
+        
     except Exception as e:
         logger.error(f"[Prometheus] Error querying {PROM_URL}: {e}")
         return []
@@ -0,0 +1,155 @@
+"""
+Redis Service
+-------------
+Small key/value store with per-key TTL, shared across workers when Redis is configured.
+
+Provides:
+  - Redis client initialization and shutdown (REDIS_URL)
+  - In-process fallback when Redis is not installed, not configured or unreachable
+  - JSON value helpers: cache_get / cache_set / cache_delete / cache_delete_prefix
+  - Raw byte helpers for pre-serialized payloads: cache_get_bytes / cache_set_bytes
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Optional
+
+import orjson
+from cachetools import TLRUCache
+
+from app.core.config import REDIS_URL
+from app.core.logging import logger
+
+# Try to import redis (optional dependency)
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None  # type: ignore
+    REDIS_AVAILABLE = False
+
+
+# Global state
+_redis = None
+REDIS_ENABLED = False
+
+# Fallback store: key -> (ttl_seconds, raw_bytes), bounded by total payload bytes.
+# Each entry expires after its own ttl; expired entries are purged on every write,
+# not only when read, and least recently used ones go first when over budget.
+LOCAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LOCAL_CACHE_MAX_ITEM_BYTES = 1024 * 1024
+
+
+def _local_ttu(_key, value, now):
+    return now + value[0]
+
+
+_local: TLRUCache = TLRUCache(
+    maxsize=LOCAL_CACHE_MAX_BYTES,
+    ttu=_local_ttu,
+    timer=time.monotonic,
+    getsizeof=lambda value: len(value[1]),
+)
+
+
+async def init_redis():
+    """Connect to Redis if REDIS_URL is set (called at startup)"""
+    global _redis, REDIS_ENABLED
+
+    if not REDIS_URL:
+        logger.info("[Redis] ⚠️ Disabled (REDIS_URL not set), using in-process cache")
+        return
+
+    if not REDIS_AVAILABLE:
+        logger.info("[Redis] ⚠️ Not installed, using in-process cache")
+        return
+
+    try:
+        _redis = aioredis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+        await _redis.ping()
+        REDIS_ENABLED = True
+        logger.info("[Redis] ✅ Connected")
+    except Exception as e:
+        logger.error(f"[Redis] ❌ Failed to connect: {e}, using in-process cache")
+        _redis = None
+        REDIS_ENABLED = False
+
+
+async def close_redis():
+    """Close the Redis connection pool (called at shutdown)"""
+    global _redis, REDIS_ENABLED
+    if _redis is not None:
+        try:
+            await _redis.aclose()
+        except Exception as e:
+            logger.warning(f"[Redis] Close error: {e}")
+    _redis = None
+    REDIS_ENABLED = False
+
+
+async def cache_get_bytes(key: str) -> Optional[bytes]:
+    """Get raw bytes, or None if missing/expired"""
+    if REDIS_ENABLED:
+        try:
+            return await _redis.get(key)
+        except Exception as e:
+            logger.warning(f"[Redis] get failed: {e}")
+            return None
+
+    entry = _local.get(key)
+    return entry[1] if entry is not None else None
+
+
+async def cache_set_bytes(key: str, raw: bytes, ttl: int):
+    """Store raw bytes for ttl seconds"""
+    if REDIS_ENABLED:
+        try:
+            await _redis.set(key, raw, ex=ttl)
+        except Exception as e:
+            logger.warning(f"[Redis] set failed: {e}")
+        return
+
+    if len(raw) > LOCAL_CACHE_MAX_ITEM_BYTES:
+        # one oversized body would evict most of the budget
+        _local.pop(key, None)
+        return
+    _local[key] = (ttl, raw)
+
+
+async def cache_get(key: str) -> Optional[Any]:
+    """Get a JSON value, or None if missing/expired"""
+    raw = await cache_get_bytes(key)
+    return orjson.loads(raw) if raw is not None else None
+
+
+async def cache_set(key: str, value: Any, ttl: int):
+    """Store a JSON-serializable value for ttl seconds"""
+    await cache_set_bytes(key, orjson.dumps(value), ttl)
+
+
+async def cache_delete(key: str):
+    """Delete a key"""
+    if REDIS_ENABLED:
+        try:
+            await _redis.delete(key)
+        except Exception as e:
+            logger.warning(f"[Redis] delete failed: {e}")
+        return
+
+    _local.pop(key, None)
+
+
+async def cache_delete_prefix(prefix: str):
+    """Delete every key starting with prefix"""
+    if REDIS_ENABLED:
+        try:
+            keys = [k async for k in _redis.scan_iter(match=f"{prefix}*", count=500)]
+            if keys:
+                await _redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"[Redis] delete_prefix failed: {e}")
+        return
+
+    for key in [k for k in list(_local.keys()) if k.startswith(prefix)]:
+        _local.pop(key, None)
@@ -1,88 +1,113 @@
 """
 Session Controller
 Manages chat session lifecycle and metadata
+
+Active sessions are cached under session:{id} in the shared cache (Redis when
+configured), so every worker sees creates/updates/deletes and memory stays bounded.
 """
 import uuid
 from typing import Optional, Dict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from pymongo import ReturnDocument
+
 from app.core.logging import logger
+from app.core.responses import orjson_dumps
+from app.services.redis_service import cache_delete, cache_get, cache_set_bytes
+
+# Cached sessions expire an hour after their last activity
+SESSION_CACHE_TTL = 3600
+
+
+def _session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+async def _cache_session(session: Dict) -> Dict:
+    """Cache a session document and return it in its JSON form (as cache hits see it)"""
+    raw = orjson_dumps(session)
+    await cache_set_bytes(_session_key(session["session_id"]), raw, SESSION_CACHE_TTL)
+    return orjson.loads(raw)
 
 
 class SessionManager:
     """Manage chat sessions and their metadata"""
 
-    def __init__(self):
-        self.active_sessions = {}  # In-memory cache
-
-    def create_session(self, db) -> str:
+    async def create_session(self, db) -> str:
         """Create a new chat session"""
         session_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
         session_data = {
             "session_id": session_id,
-            "created_at": datetime.utcnow(),
-            "last_activity": datetime.utcnow(),
+            "created_at": now,
+            "last_activity": now,
             "message_count": 0,
             "total_tokens": 0,
         }
         if db is not None:
             try:
-                db.chat_sessions.insert_one(session_data)
+                await db.chat_sessions.insert_one(session_data)
                 logger.info(f"[Session] Created new session: {session_id}")
             except Exception as e:
                 logger.error(f"[Session] Failed to create session in DB: {e}")
-        self.active_sessions[session_id] = session_data
+        await _cache_session(session_data)
         return session_id
 
-    def get_session(self, session_id: str, db) -> Optional[Dict]:
-        """Get session by ID"""
-        if session_id in self.active_sessions:
-            return self.active_sessions[session_id]
+    async def get_session(self, session_id: str, db) -> Optional[Dict]:
+        """Get session by ID (JSON form: ids and datetimes as strings)"""
+        cached = await cache_get(_session_key(session_id))
+        if cached is not None:
+            return cached
         if db is not None:
             try:
-                session = db.chat_sessions.find_one({"session_id": session_id})
+                session = await db.chat_sessions.find_one({"session_id": session_id})
                 if session:
-                    self.active_sessions[session_id] = session
-                    return session
+                    return await _cache_session(session)
             except Exception as e:
                 logger.error(f"[Session] Failed to fetch session: {e}")
         return None
 
-    def update_session(self, session_id: str, db, tokens: int = 0):
+    async def update_session(self, session_id: str, db, tokens: int = 0):
         """Update session activity"""
-        now = datetime.utcnow()
+        now = datetime.now(timezone.utc)
         if db is not None:
             try:
-                db.chat_sessions.update_one(
+                session = await db.chat_sessions.find_one_and_update(
                     {"session_id": session_id},
                     {
                         "$set": {"last_activity": now},
                         "$inc": {"message_count": 1, "total_tokens": tokens},
                     },
+                    return_document=ReturnDocument.AFTER,
                 )
+                if session:
+                    # Refresh the cached copy and its TTL
+                    await _cache_session(session)
+                return
             except Exception as e:
                 logger.error(f"[Session] Failed to update session: {e}")
 
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]["last_activity"] = now
-            self.active_sessions[session_id]["message_count"] = self.active_sessions[session_id].get("message_count", 0) + 1
-            self.active_sessions[session_id]["total_tokens"] = self.active_sessions[session_id].get("total_tokens", 0) + tokens
+        cached = await cache_get(_session_key(session_id))
+        if cached is not None:
+            cached["last_activity"] = now
+            cached["message_count"] = cached.get("message_count", 0) + 1
+            cached["total_tokens"] = cached.get("total_tokens", 0) + tokens
+            await _cache_session(cached)
+
+    async def evict_session(self, session_id: str):
+        """Drop a session from the shared cache (after deleting it from the DB)"""
+        await cache_delete(_session_key(session_id))
 
-    def cleanup_old_sessions(self, db, hours: int = 24):
+    async def cleanup_old_sessions(self, db, hours: int = 24):
         """Remove sessions older than specified hours"""
         if db is None:
             return
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
         try:
-            result = db.chat_sessions.delete_many({"last_activity": {"$lt": cutoff}})
+            result = await db.chat_sessions.delete_many({"last_activity": {"$lt": cutoff}})
             if result.deleted_count > 0:
                 logger.info(f"[Session] Cleaned up {result.deleted_count} old sessions")
-
-            to_remove = [
-                sid for sid, data in self.active_sessions.items()
-                if data.get("last_activity", datetime.utcnow()) < cutoff
-            ]
-            for sid in to_remove:
-                del self.active_sessions[sid]
         except Exception as e:
             logger.error(f"[Session] Cleanup failed: {e}")
 
@@ -112,15 +112,17 @@ async function fetchJson(url, opts = {}) {
 async function fetchAllPages(endpoint, key, pageSize = DEFAULT_PAGE_SIZE) {
   const all = [];
   let skip = 0;
+  let after = null;
 
   // To prevent infinite loops when backend ignores skip/limit
   let lastFirstId = null;
 
   for (let page = 0; page < MAX_PAGES; page++) {
-    const qs = new URLSearchParams({
-      limit: String(pageSize),
-      skip: String(skip),
-    }).toString();
+    // Prefer the keyset cursor; fall back to skip for endpoints without one
+    const params = { limit: String(pageSize) };
+    if (after) params.after = after;
+    else params.skip = String(skip);
+    const qs = new URLSearchParams(params).toString();
 
     const url = `${API_BASE_URL}/${endpoint}?${qs}`;
     const data = await fetchJson(url);
@@ -138,12 +140,28 @@ async function fetchAllPages(endpoint, key, pageSize = DEFAULT_PAGE_SIZE) {
     // If last page
     if (list.length < pageSize) break;
 
+    after = data?.next_cursor || null;
     skip += pageSize;
   }
 
   return all;
 }
 
+/**
+ * Test email/Slack endpoints answer 202 with a task_id and send in the background.
+ * Poll /agent/test-status/{task_id} until it is no longer pending; throw on failure.
+ */
+async function waitForTestAlert(accepted, { intervalMs = 1000, timeoutMs = 60000 } = {}) {
+  const deadline = Date.now() + timeoutMs;
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    const state = await fetchJson(`${API_BASE_URL}/agent/test-status/${accepted.task_id}`);
+    if (state.status === "sent") return state;
+    if (state.status === "failed") throw new Error(state.detail || "Test message failed");
+  }
+  throw new Error("Timed out waiting for the test message");
+}
+
 export const api = {
   // ============ HEALTH & STATS ============
 
@@ -214,7 +232,8 @@ export const api = {
   },
 
   async sendTestEmail() {
-    return fetchJson(`${API_BASE_URL}/agent/test-email`, { method: "POST" });
+    const accepted = await fetchJson(`${API_BASE_URL}/agent/test-email`, { method: "POST" });
+    return waitForTestAlert(accepted);
   },
 
   // ============ SLACK (ENV ONLY) ============
@@ -224,7 +243,8 @@ export const api = {
   },
 
   async sendTestSlack() {
-    return fetchJson(`${API_BASE_URL}/agent/test-slack`, { method: "POST" });
+    const accepted = await fetchJson(`${API_BASE_URL}/agent/test-slack`, { method: "POST" });
+    return waitForTestAlert(accepted);
   },
 
   // ============ SERVER / TARGET MANAGEMENT ============